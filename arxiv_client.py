@@ -3,17 +3,40 @@ import datetime
 import requests
 import io
 import os
+import re
+import time
+import xml.etree.ElementTree as ET
 from pypdf import PdfReader
 from typing import List
+from cassette import Cassette, CassetteMiss
+
+OAI_NS = {
+    'oai': 'http://www.openarchives.org/OAI/2.0/',
+    'arxiv': 'http://arxiv.org/OAI/arXiv/',
+}
+
+# 在 OAI-PMH 中作为顶层 set 的 archive，其余 archive 属于 physics set
+OAI_TOP_LEVEL_SETS = {'cs', 'econ', 'eess', 'math', 'q-bio', 'q-fin', 'stat'}
 
 class ArxivClient:
-    def __init__(self):
+    def __init__(self, cassette=None):
         self.client = arxiv.Client()
+        self.cassette = cassette or Cassette('off')
+        self.oai_url = os.getenv('ARXIV_OAI_URL', 'https://export.arxiv.org/oai2')
 
     def download_pdf_text(self, pdf_url: str, max_pages: int = 15) -> str:
         """
         下载 PDF 并提取文本
         """
+        try:
+            return self.cassette.call('arxiv', 'download_pdf_text', {'pdf_url': pdf_url, 'max_pages': max_pages},
+                                      lambda: self._download_pdf_text(pdf_url, max_pages))
+        except CassetteMiss as e:
+            # 与线上下载失败一致，返回空文本
+            print(f"提取 PDF 文本失败 ({pdf_url}): {e}")
+            return ""
+
+    def _download_pdf_text(self, pdf_url: str, max_pages: int) -> str:
         try:
             response = requests.get(pdf_url)
             if response.status_code != 200:
@@ -39,7 +62,11 @@ class ArxivClient:
         """
         if not categories:
             return []
-        
+        args = {'categories': categories, 'max_results': max_results, 'since_date': since_date}
+        return self.cassette.call('arxiv', 'fetch_by_categories', args,
+                                  lambda: self._fetch_by_categories(categories, max_results, since_date))
+
+    def _fetch_by_categories(self, categories, max_results, since_date):
         # 构造分类查询语句，例如 cat:cs.CL OR cat:cs.AI
         query = " OR ".join([f'cat:{cat}' for cat in categories])
         
@@ -63,7 +90,8 @@ class ArxivClient:
                 'pdf_url': result.pdf_url,
                 'authors': [author.name for author in result.authors],
                 'published': result.published,
-                'comment': result.comment if result.comment else ""
+                'comment': result.comment if result.comment else "",
+                'doi': result.doi if result.doi else ""
             })
         
         return papers
@@ -74,7 +102,10 @@ class ArxivClient:
         """
         if not keywords:
             return []
-        
+        return self.cassette.call('arxiv', 'search_papers', {'keywords': keywords, 'max_results': max_results},
+                                  lambda: self._search_papers(keywords, max_results))
+
+    def _search_papers(self, keywords, max_results):
         # 简单地将关键词拼接成查询语句，或者取前几个重要的
         query = " OR ".join([f'abs:"{k}"' for k in keywords[:5]])
         
@@ -94,11 +125,119 @@ class ArxivClient:
                 'pdf_url': result.pdf_url,
                 'authors': [author.name for author in result.authors],
                 'published': result.published,
-                'comment': result.comment if result.comment else ""
+                'comment': result.comment if result.comment else "",
+                'doi': result.doi if result.doi else ""
             })
         
         return papers
 
+    @staticmethod
+    def _oai_set(category):
+        """将分类映射为 OAI-PMH set，例如 cs.DC -> cs, hep-th -> physics:hep-th"""
+        archive = category.split('.')[0]
+        return archive if archive in OAI_TOP_LEVEL_SETS else f"physics:{archive}"
+
+    def _oai_request(self, params, max_retries=5):
+        """
+        请求一页 OAI-PMH 结果，遵循服务端 503 + Retry-After 的限流约定
+        """
+        def fetch():
+            for _ in range(max_retries):
+                response = requests.get(self.oai_url, params=params, timeout=60)
+                if response.status_code == 503:
+                    time.sleep(int(response.headers.get('Retry-After', 10)))
+                    continue
+                response.raise_for_status()
+                return response.text
+            raise RuntimeError(f"OAI-PMH 请求多次被限流: {params}")
+
+        return self.cassette.call('arxiv', 'oai_list_records', params, fetch)
+
+    @staticmethod
+    def _parse_oai_record(record):
+        header = record.find('oai:header', OAI_NS)
+        if header is None or header.get('status') == 'deleted':
+            return None
+        meta = record.find('oai:metadata/arxiv:arXiv', OAI_NS)
+        if meta is None:
+            return None
+
+        def text(tag):
+            node = meta.find(f'arxiv:{tag}', OAI_NS)
+            return re.sub(r'\s+', ' ', node.text).strip() if node is not None and node.text else ""
+
+        arxiv_id = text('id')
+        authors = []
+        for author in meta.findall('arxiv:authors/arxiv:author', OAI_NS):
+            keyname = author.findtext('arxiv:keyname', default='', namespaces=OAI_NS)
+            forenames = author.findtext('arxiv:forenames', default='', namespaces=OAI_NS)
+            authors.append(f"{forenames} {keyname}".strip())
+
+        created = text('created')
+        published = datetime.datetime.fromisoformat(created).replace(tzinfo=datetime.timezone.utc) if created else None
+        return {
+            'title': text('title'),
+            'summary': text('abstract'),
+            'url': f"http://arxiv.org/abs/{arxiv_id}",
+            'pdf_url': f"http://arxiv.org/pdf/{arxiv_id}",
+            'authors': authors,
+            'published': published,
+            'comment': text('comments'),
+            'doi': text('doi'),
+            'categories': text('categories').split(),
+            'datestamp': header.findtext('oai:datestamp', default='', namespaces=OAI_NS),
+        }
+
+    def harvest_oai(self, categories: List[str], from_date: datetime.date, max_age_days: int = 3):
+        """
+        通过 OAI-PMH ListRecords 增量收割 from_date（含）之后新增或更新的论文，自动跟随 resumptionToken
+        元数据更新（如新版本）也会产生新的 datestamp，因此过滤掉提交时间早于 from_date - max_age_days 的论文
+        返回: (papers, 下次收割的起始 datestamp；收割不完整时为 None)
+        """
+        wanted = set(categories)
+        min_published = datetime.datetime.combine(
+            from_date - datetime.timedelta(days=max_age_days), datetime.time(), tzinfo=datetime.timezone.utc)
+        papers = {}
+        latest_datestamp = from_date.isoformat()
+        failed = False
+
+        for oai_set in sorted({self._oai_set(c) for c in categories}):
+            params = {'verb': 'ListRecords', 'metadataPrefix': 'arXiv', 'set': oai_set, 'from': from_date.isoformat()}
+            while params:
+                try:
+                    root = ET.fromstring(self._oai_request(params))
+                except Exception as e:
+                    print(f"OAI-PMH 收割失败 ({oai_set}): {e}")
+                    failed = True
+                    break
+
+                error = root.find('oai:error', OAI_NS)
+                if error is not None:
+                    if error.get('code') != 'noRecordsMatch':
+                        print(f"OAI-PMH 返回错误 ({oai_set}): {error.get('code')} {error.text}")
+                        failed = True
+                    break
+
+                list_records = root.find('oai:ListRecords', OAI_NS)
+                if list_records is None:
+                    break
+                for record in list_records.findall('oai:record', OAI_NS):
+                    datestamp = record.findtext('oai:header/oai:datestamp', default='', namespaces=OAI_NS)
+                    latest_datestamp = max(latest_datestamp, datestamp)
+                    paper = self._parse_oai_record(record)
+                    if not paper or not wanted.intersection(paper['categories']):
+                        continue
+                    if paper['published'] and paper['published'] < min_published:
+                        continue
+                    papers[paper['url']] = paper
+
+                token = list_records.findtext('oai:resumptionToken', default='', namespaces=OAI_NS).strip()
+                # 使用 resumptionToken 时不能再携带其他参数
+                params = {'verb': 'ListRecords', 'resumptionToken': token} if token else None
+
+        # 收割不完整时不推进游标，下次从同一天重新开始
+        return list(papers.values()), None if failed else latest_datestamp
+
 if __name__ == "__main__":
     client = ArxivClient()
     papers = client.search_papers(["Large Language Models", "Agent"])
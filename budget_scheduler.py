@@ -0,0 +1,116 @@
+import os
+
+
+class BudgetScheduler:
+    """
+    基于 token / 美元预算调度单次运行中的 LLM 调用
+
+    预算为 0 表示不限制。筛选阶段最多使用 SCREENING_BUDGET_RATIO 比例的预算，
+    剩余部分留给按筛选得分排序后的全文深度分析。
+    """
+    def __init__(self):
+        self.token_budget = int(os.getenv('DAILY_TOKEN_BUDGET') or 0)
+        self.cost_budget = float(os.getenv('DAILY_COST_BUDGET') or 0)
+        # 每百万 token 的价格 (USD)，默认按 Claude 3.5 Sonnet 计价
+        self.input_price = float(os.getenv('LLM_INPUT_PRICE_PER_MTOK') or 3.0)
+        self.output_price = float(os.getenv('LLM_OUTPUT_PRICE_PER_MTOK') or 15.0)
+        # 命中 prompt 缓存的输入 token 价格，未配置时按普通输入计价
+        self.cached_input_price = float(os.getenv('LLM_CACHED_INPUT_PRICE_PER_MTOK') or self.input_price)
+        # 写入缓存的输入 token 相对普通输入的价格倍数（Anthropic 为 1.25）
+        self.cache_write_multiplier = float(os.getenv('LLM_CACHE_WRITE_PRICE_MULTIPLIER') or 1.25)
+        self.screening_ratio = float(os.getenv('SCREENING_BUDGET_RATIO') or 0.5)
+        # 单次分析输出的预估 token 数，以及下载全文前对全文长度的预估（字符数）
+        self.expected_output_tokens = int(os.getenv('LLM_EXPECTED_OUTPUT_TOKENS') or 800)
+        self.full_text_chars = int(os.getenv('FULL_TEXT_ESTIMATE_CHARS') or 45000)
+        self.reset()
+
+    def reset(self):
+        """清空已用额度"""
+        self.used_input_tokens = 0
+        self.used_cached_tokens = 0
+        self.used_output_tokens = 0
+        self.used_cost = 0.0
+
+    @property
+    def enabled(self):
+        return self.token_budget > 0 or self.cost_budget > 0
+
+    @staticmethod
+    def estimate_tokens(text):
+        """
+        粗略估算文本 token 数：ASCII 约 4 字符 / token，中文等非 ASCII 约 1 字符 / token
+        """
+        if not text:
+            return 0
+        non_ascii = sum(1 for ch in text if ord(ch) > 127)
+        return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+    def estimate_full_text_tokens(self):
+        """下载全文前，按 FULL_TEXT_ESTIMATE_CHARS 预估全文的 token 数（按 ASCII 文本计）"""
+        return self.full_text_chars // 4 + 1
+
+    def estimate_messages(self, messages):
+        """估算一组 chat messages 的输入 token 数"""
+        total = 0
+        for message in messages:
+            content = message.get('content', '')
+            if isinstance(content, list):
+                content = "".join(part.get('text', '') for part in content)
+            total += self.estimate_tokens(content) + 4
+        return total
+
+    def cost_of(self, input_tokens, output_tokens):
+        return (input_tokens * self.input_price + output_tokens * self.output_price) / 1_000_000
+
+    def _fits(self, input_tokens, output_tokens, ratio):
+        if self.token_budget > 0:
+            used = self.used_input_tokens + self.used_output_tokens
+            if used + input_tokens + output_tokens > self.token_budget * ratio:
+                return False
+        if self.cost_budget > 0:
+            if self.used_cost + self.cost_of(input_tokens, output_tokens) > self.cost_budget * ratio:
+                return False
+        return True
+
+    def can_screen(self, input_tokens):
+        """筛选调用是否仍在筛选阶段的预算份额之内"""
+        if not self.enabled:
+            return True
+        return self._fits(input_tokens, self.expected_output_tokens, self.screening_ratio)
+
+    def can_analyze(self, input_tokens):
+        """深度分析调用是否仍在总预算之内"""
+        if not self.enabled:
+            return True
+        return self._fits(input_tokens, self.expected_output_tokens, 1.0)
+
+    def charge(self, usage, estimated_input_tokens=0):
+        """
+        记录一次调用的实际消耗；usage 缺失时退回到预估值
+        """
+        cached_tokens = 0
+        cache_write_tokens = 0
+        if usage:
+            input_tokens = usage.get('prompt_tokens', 0)
+            output_tokens = usage.get('completion_tokens', 0)
+            cached_tokens = min(usage.get('cached_tokens', 0), input_tokens)
+            cache_write_tokens = min(usage.get('cache_write_tokens', 0), input_tokens - cached_tokens)
+        else:
+            input_tokens = estimated_input_tokens
+            output_tokens = self.expected_output_tokens
+        self.used_input_tokens += input_tokens
+        self.used_cached_tokens += cached_tokens
+        self.used_output_tokens += output_tokens
+        self.used_cost += self.cost_of(input_tokens - cached_tokens - cache_write_tokens, output_tokens)
+        self.used_cost += cached_tokens * self.cached_input_price / 1_000_000
+        self.used_cost += cache_write_tokens * self.input_price * self.cache_write_multiplier / 1_000_000
+
+    def summary(self):
+        used = self.used_input_tokens + self.used_output_tokens
+        text = (f"已用 {used} tokens (输入 {self.used_input_tokens}，其中缓存命中 {self.used_cached_tokens} / "
+                f"输出 {self.used_output_tokens})，约 ${self.used_cost:.4f}")
+        if self.token_budget > 0:
+            text += f"，token 预算 {self.token_budget}"
+        if self.cost_budget > 0:
+            text += f"，美元预算 ${self.cost_budget:.2f}"
+        return text
@@ -0,0 +1,198 @@
+import os
+import gzip
+import json
+import copy
+import base64
+import random
+import shutil
+import hashlib
+import datetime
+from collections import defaultdict, deque
+
+
+class CassetteMiss(KeyError):
+    """回放时找不到对应的录制记录"""
+
+
+def _encode(x):
+    # datetime 需要在回放时还原为原类型
+    if isinstance(x, datetime.datetime):
+        return {'__datetime__': x.isoformat()}
+    if hasattr(x, 'isoformat'):
+        return x.isoformat()
+    return str(x)
+
+
+def _decode(obj):
+    if '__datetime__' in obj and len(obj) == 1:
+        return datetime.datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+class Cassette:
+    """
+    外部调用的录制 / 回放
+
+    record 模式下，ArxivClient、ZoteroClient、LLMAgent、EmailSender 的每次外部请求及其返回
+    都会写入一个 gzip 压缩的 JSONL 文件（首行为元数据，包括运行开始时的本地状态文件快照、非敏感的运行配置和随机种子）；
+    replay 模式下直接从该文件返回结果，不访问网络，使一次线上运行可以离线、确定性地重放。
+    回放时没有录制记录的调用会抛出 CassetteMiss，各客户端按该调用在线上失败时的方式处理，
+    运行结束时由 report_misses 汇总列出。
+    """
+    def __init__(self, mode=None, path=None):
+        self.mode = (mode or os.getenv('CASSETTE_MODE') or 'off').lower()
+        if self.mode not in ('off', 'record', 'replay'):
+            raise ValueError(f"未知的 cassette 模式: {self.mode}")
+        self.path = os.path.abspath(path or os.getenv('CASSETTE_PATH') or 'cassettes/latest.jsonl.gz')
+        self.meta = {}
+        self._recorded = []
+        self._by_key = defaultdict(deque)
+        self._by_fallback = defaultdict(deque)
+        # 回放时找不到录制记录的调用
+        self.misses = []
+        if self.recording:
+            self.meta = {
+                'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'seed': random.randrange(2 ** 31),
+                'files': {},
+                'env': {},
+            }
+        elif self.replaying:
+            self._load()
+
+    @property
+    def recording(self):
+        return self.mode == 'record'
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    @property
+    def seed(self):
+        """录制时生成、回放时复用的随机种子，保证抽样等随机行为可重现"""
+        return self.meta.get('seed')
+
+    @staticmethod
+    def _key(service, operation, args):
+        payload = json.dumps([service, operation, args], ensure_ascii=False, sort_keys=True, default=_encode)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def call(self, service, operation, args, func, fallback=None):
+        """
+        执行一次外部调用：off 模式直接执行；record 模式执行并记录；replay 模式返回录制结果
+
+        回放时优先按参数精确匹配。参数变化（例如修改了 prompt）时，若调用方提供了 fallback
+        （如论文 ID 和分析阶段），则返回同一 fallback 下尚未使用的录制结果；否则视为没有录制记录。
+        """
+        if self.mode == 'off':
+            return func()
+
+        key = self._key(service, operation, args)
+        fallback_key = self._key(service, operation, fallback) if fallback is not None else None
+        if self.replaying:
+            return self._replay(service, operation, key, fallback_key)
+
+        entry = {'service': service, 'operation': operation, 'key': key}
+        if fallback_key:
+            entry['fallback'] = fallback_key
+        try:
+            result = func()
+        except Exception as e:
+            entry['error'] = f"{type(e).__name__}: {e}"
+            self._recorded.append(entry)
+            raise
+        # 复制一份，避免调用方后续修改返回对象影响录制内容
+        entry['response'] = copy.deepcopy(result)
+        self._recorded.append(entry)
+        return result
+
+    def _replay(self, service, operation, key, fallback_key):
+        exact = self._by_key[key]
+        similar = self._by_fallback[fallback_key] if fallback_key else None
+        if exact:
+            entry = exact.popleft()
+            if entry.get('fallback'):
+                self._by_fallback[entry['fallback']].remove(entry)
+        elif similar:
+            entry = similar.popleft()
+            self._by_key[entry['key']].remove(entry)
+            print(f"cassette 中没有 {service}.{operation} 的精确匹配，按相同的 fallback 回放")
+        else:
+            self.misses.append(f"{service}.{operation}")
+            raise CassetteMiss(f"cassette 中没有 {service}.{operation} 的记录")
+        if 'error' in entry:
+            raise RuntimeError(f"[replay] {entry['error']}")
+        return entry['response']
+
+    def snapshot_files(self, paths):
+        """录制开始时保存本地状态文件，回放时据此还原运行前的状态"""
+        if not self.recording:
+            return
+        for path in paths:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self.meta['files'][path] = base64.b64encode(f.read()).decode('ascii')
+
+    def snapshot_env(self, names):
+        """录制开始时保存非敏感的运行配置（分类、预算、本地模型参数等）"""
+        if not self.recording:
+            return
+        self.meta['env'] = {name: os.environ.get(name) for name in names}
+
+    def restore_env(self):
+        """回放时使用录制时的运行配置，使回放结果不依赖本地的 .env"""
+        if not self.replaying:
+            return
+        for name, value in self.meta.get('env', {}).items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    def restore_workspace(self):
+        """
+        回放时创建独立的工作目录并写入状态文件快照，避免回放修改线上状态
+        工作目录会先被清空，上一次回放留下的状态文件不会影响本次回放
+        返回: 工作目录路径
+        """
+        workspace = self.path + ".workspace"
+        shutil.rmtree(workspace, ignore_errors=True)
+        os.makedirs(workspace)
+        for path, content in self.meta.get('files', {}).items():
+            target = os.path.join(workspace, path)
+            os.makedirs(os.path.dirname(target) or workspace, exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(base64.b64decode(content))
+        return workspace
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                record = json.loads(line, object_hook=_decode)
+                if i == 0:
+                    self.meta = record.get('meta', {})
+                    continue
+                self._by_key[record['key']].append(record)
+                if record.get('fallback'):
+                    self._by_fallback[record['fallback']].append(record)
+
+    def report_misses(self):
+        """回放结束时汇总没有录制记录的调用"""
+        if not self.misses:
+            return
+        counts = defaultdict(int)
+        for miss in self.misses:
+            counts[miss] += 1
+        details = ", ".join(f"{name} x{n}" for name, n in sorted(counts.items()))
+        print(f"回放中有 {len(self.misses)} 次调用没有录制记录，已按调用失败处理: {details}")
+
+    def save(self):
+        if not self.recording:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'meta': self.meta}, ensure_ascii=False) + "\n")
+            for entry in self._recorded:
+                f.write(json.dumps(entry, ensure_ascii=False, default=_encode) + "\n")
+        print(f"cassette 已保存: {self.path} ({len(self._recorded)} 条记录)")
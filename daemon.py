@@ -0,0 +1,188 @@
+import os
+import time
+import signal
+import logging
+import datetime
+from collections import deque
+from main import PaperAgent
+from trace_store import TraceStore, paper_id
+
+
+class PaperDaemon:
+    """
+    常驻服务模式
+
+    复用同一个 PaperAgent（及其客户端、兴趣画像、本地模型等缓存），定期通过 arXiv OAI-PMH
+    增量收割新论文并立即筛选和分析，分析结果先暂存，按计划的时间统一生成报告并发送。
+    收割游标、已处理的论文 ID 以及待发送的结果保存在 agent_state.json 的 daemon 字段中，重启后可继续。
+    """
+    def __init__(self, agent=None):
+        self.agent = agent or PaperAgent()
+        self.poll_interval = float(os.getenv('DAEMON_POLL_MINUTES') or 30) * 60
+        self.report_hour = int(os.getenv('DAEMON_REPORT_HOUR_UTC') or 1)
+        # arXiv 每天公告一次新论文，完整收割过一次后直到下一个公告窗口才再次收割
+        self.harvest_hour = int(os.getenv('DAEMON_HARVEST_HOUR_UTC') or 1)
+        self.profile_ttl = float(os.getenv('DAEMON_PROFILE_REFRESH_HOURS') or 6) * 3600
+        max_seen = int(os.getenv('DAEMON_MAX_SEEN_IDS') or 20000)
+
+        state = self.agent._load_state().get('daemon', {})
+        self.harvest_from = state.get('harvest_from')
+        # 最近一次完整收割的时间
+        self.last_harvest_at = state.get('last_harvest_at')
+        self.seen_ids = deque(state.get('seen_ids', []), maxlen=max_seen)
+        self._seen_set = set(self.seen_ids)
+        # 已分析、等待下次报告的论文
+        self.pending = self.agent._deserialize_papers(state.get('pending_papers', []))
+        # 因当日预算不足尚未筛选的论文，包括定时任务模式推迟到下次运行的论文
+        self.queue = self.agent._deserialize_papers(state.get('queued_papers', [])) + self.agent._get_deferred_papers()
+        # 已在 Zotero 库中而被跳过的论文，随下次报告列出
+        self.owned = state.get('owned_papers', [])
+        self.last_report_date = state.get('last_report_date')
+
+        self._user_interests = None
+        self._interests_loaded_at = 0.0
+        self._budget_day = None
+        # 当日筛选预算已用尽，队列等到预算重置后再处理
+        self._queue_blocked = False
+        self._stopping = False
+
+    def _mark_seen(self, pid):
+        if len(self.seen_ids) == self.seen_ids.maxlen:
+            self._seen_set.discard(self.seen_ids[0])
+        self.seen_ids.append(pid)
+        self._seen_set.add(pid)
+
+    def _save(self, now):
+        self.agent._save_state(
+            # 同步更新 last_run_time，切回定时任务模式时不会重复处理；
+            # 待发送和排队的论文保存在 daemon 字段中，切回定时任务模式时由 main.py 接管
+            last_run_time=now.isoformat(),
+            deferred_papers=[],
+            daemon={
+                'harvest_from': self.harvest_from,
+                'last_harvest_at': self.last_harvest_at,
+                'seen_ids': list(self.seen_ids),
+                'pending_papers': self.agent._serialize_papers(self.pending),
+                'queued_papers': self.agent._serialize_papers(self.queue),
+                'owned_papers': self.owned,
+                'last_report_date': self.last_report_date,
+            }
+        )
+
+    def _start_day(self, today):
+        """每天重置预算，并把 trace 写入当天的运行目录"""
+        if self._budget_day == today:
+            return
+        self._budget_day = today
+        self.agent.budget.reset()
+        self._queue_blocked = False
+        if self.agent.trace is not None:
+            self.agent.trace.close()
+        # 与定时任务的运行 ID 使用相同的时间前缀，按名称排序即为时间顺序
+        self.agent.trace = TraceStore(run_id=f"{today.strftime('%Y%m%d')}T000000Z-daemon")
+        logging.info(f"进入新的一天 {today.isoformat()}，预算已重置，trace 写入: {self.agent.trace.run_dir}")
+        self.queue = self.agent._drop_expired_deferred(
+            self.queue, datetime.datetime.combine(today, datetime.time(), tzinfo=datetime.timezone.utc))
+
+    def _get_user_interests(self):
+        if self._user_interests is None or time.monotonic() - self._interests_loaded_at > self.profile_ttl:
+            self._user_interests = self.agent._get_user_interests()
+            self._interests_loaded_at = time.monotonic()
+        return self._user_interests
+
+    def _harvest_due(self, now):
+        """上次完整收割早于最近一个公告窗口时才需要收割"""
+        if not self.last_harvest_at:
+            return True
+        window = now.replace(hour=self.harvest_hour, minute=0, second=0, microsecond=0)
+        if now < window:
+            window -= datetime.timedelta(days=1)
+        return datetime.datetime.fromisoformat(self.last_harvest_at) < window
+
+    def _report_due(self, now):
+        return now.hour >= self.report_hour and self.last_report_date != now.date().isoformat()
+
+    def tick(self):
+        """执行一轮：收割新论文、筛选分析，并在到期时发送报告"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        today = now.date()
+        self._start_day(today)
+
+        papers, next_from = [], None
+        if self._harvest_due(now):
+            from_date = (datetime.date.fromisoformat(self.harvest_from) if self.harvest_from
+                         else today - datetime.timedelta(days=1))
+            papers, next_from = self.agent.arxiv.harvest_oai(self.agent._get_categories(), from_date)
+        new_papers = [p for p in papers if paper_id(p) not in self._seen_set]
+        for paper in new_papers:
+            self.agent.trace.log('fetch', paper, metadata=paper)
+        if papers:
+            logging.info(f"OAI-PMH 收割到 {len(papers)} 篇论文，其中新论文 {len(new_papers)} 篇。")
+
+        if new_papers or (self.queue and not self._queue_blocked):
+            # 先刷新兴趣画像（同时增量更新 Zotero 论文库索引），再剔除已收藏的论文
+            user_interests = self._get_user_interests()
+            new_papers_to_screen, owned = self.agent._filter_owned(new_papers)
+            self.owned.extend({'title': p['title'], 'url': p['url']} for p in owned)
+            if self._queue_blocked:
+                # 预算已用尽时不再每轮重复筛选整个队列，新论文直接排队
+                self.agent._defer(new_papers_to_screen)
+                self.queue.extend(new_papers_to_screen)
+                todo = []
+            else:
+                todo = self.queue + new_papers_to_screen
+            if todo:
+                candidates, self.queue = self.agent._screen_papers(todo, user_interests)
+                self._queue_blocked = bool(self.queue)
+                self.agent.relevance.save()
+                analyzed = self.agent._analyze_candidates(candidates, user_interests)
+                self.pending.extend(analyzed)
+                logging.info(f"本轮新增 {len(analyzed)} 篇推荐论文，待发送 {len(self.pending)} 篇。"
+                             f"LLM 预算使用情况: {self.agent.budget.summary()}")
+
+        # 处理完成后再推进游标，中途失败时下一轮会重新收割这些论文
+        for paper in new_papers:
+            self._mark_seen(paper_id(paper))
+        if next_from:
+            # 收割完整时才推进游标，否则下一轮重试
+            self.harvest_from = next_from
+            self.last_harvest_at = now.isoformat()
+
+        if self._report_due(now):
+            if self.pending:
+                self.agent._deliver_report(self.pending, deferred_count=len(self.queue), owned_papers=self.owned)
+            else:
+                logging.info("报告时间已到，但没有待发送的论文。")
+            self.pending = []
+            self.owned = []
+            self.last_report_date = today.isoformat()
+
+        self._save(now)
+
+    def _stop(self, signum, frame):
+        logging.info(f"收到信号 {signum}，将在本轮结束后退出。")
+        self._stopping = True
+
+    def run_forever(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        logging.info(f"常驻模式启动，每 {self.poll_interval / 60:.0f} 分钟收割一次，每天 UTC {self.report_hour} 点发送报告。")
+        try:
+            while not self._stopping:
+                try:
+                    self.tick()
+                except Exception as e:
+                    logging.error(f"本轮处理失败: {e}")
+                deadline = time.monotonic() + self.poll_interval
+                while not self._stopping and time.monotonic() < deadline:
+                    time.sleep(1)
+        finally:
+            if self.agent.trace is not None:
+                self.agent.trace.close()
+            self.agent.cassette.save()
+            self.agent.cassette.report_misses()
+            logging.info("常驻模式已退出。")
+
+
+if __name__ == "__main__":
+    PaperDaemon().run_forever()
@@ -4,9 +4,11 @@ from email.mime.multipart import MIMEMultipart
 import os
 import markdown
 import logging
+from cassette import Cassette, CassetteMiss
 
 class EmailSender:
-    def __init__(self):
+    def __init__(self, cassette=None):
+        self.cassette = cassette or Cassette('off')
         self.smtp_server = os.getenv("SMTP_SERVER")
         self.smtp_port = int(os.getenv("SMTP_PORT", 465))
         self.smtp_user = os.getenv("SMTP_USER")
@@ -18,6 +20,16 @@ class EmailSender:
             logging.warning("邮件配置不完整，跳过邮件发送。")
             return False
 
+        # 回放时不会真正发送邮件，直接返回录制时的发送结果
+        try:
+            return self.cassette.call('email', 'send_report', {'subject': subject, 'content': markdown_content},
+                                      lambda: self._send(subject, markdown_content), fallback={'subject': subject})
+        except CassetteMiss as e:
+            # 与线上发送失败一致，返回 False
+            logging.error(f"邮件发送失败: {e}")
+            return False
+
+    def _send(self, subject, markdown_content):
         try:
             # 将 Markdown 转换为 HTML
             html_content = markdown.markdown(markdown_content)
@@ -2,12 +2,56 @@ import os
 import json
 from openai import OpenAI
 from dotenv import load_dotenv
+from cassette import Cassette
+from trace_store import paper_id
 
 load_dotenv()
 
+# 评分标准和校准示例：在整次运行中保持不变，放在可缓存前缀中。
+# Claude / OpenAI 的 prompt 缓存要求前缀至少 1024 token，这部分内容同时保证前缀达到该长度。
+SCORING_RUBRIC = """评分标准（请严格按照以下标准打分，保证不同论文之间的分数可比）：
+
+一、relevance_score（0-10 的整数）：论文与用户兴趣主题的相关程度。
+- 10：论文的核心问题正是用户兴趣主题中的某个方向，方法和实验场景都与用户的研究直接相关，用户几乎一定会阅读。
+- 8-9：论文的主要贡献落在用户关注的方向上，或提出的方法可以直接用于用户关注的问题，只是场景或假设略有不同。
+- 7：论文与用户兴趣有明确交集（例如同一类系统、同一类硬件、同一类算法），值得用户花时间阅读摘要和实验部分。
+- 5-6：论文属于相邻领域，只有部分技术手段或背景与用户兴趣相关，用户可能会顺带浏览。
+- 3-4：论文与用户兴趣仅在宽泛的学科层面相关（例如同属机器学习或计算机系统），没有具体的交集。
+- 0-2：论文与用户兴趣无关。
+注意：只根据用户兴趣主题判断相关度，不要因为论文质量高或话题热门而提高相关度；也不要因为论文质量一般而降低相关度，质量由其他字段单独评价。
+
+二、is_low_quality（布尔值）：满足以下任一条件时为 true，否则为 false。
+- 内容明显不完整，例如只有提纲、占位文字或大段重复的文字。
+- 没有任何实验、证明或系统实现来支撑其主要结论，且结论明显夸大。
+- 主要内容是对已有工作的简单拼接或改写，没有新的观点、数据或方法。
+- 摘要或正文存在大量事实错误、概念混淆或与标题严重不符的情况。
+仅仅是篇幅较短、来自不知名机构、写作不够精炼或是 workshop 论文，都不应判定为低质量。
+
+三、top_conference_probability（0-100 的整数）：论文被该领域顶级会议或期刊（如 OSDI、SOSP、NSDI、ISCA、MICRO、ASPLOS、NeurIPS、ICML、ICLR 等）接收的可能性。
+- 80-100：问题重要、方法新颖、实验充分且对比了最新的基线，或论文已注明被顶级会议接收。
+- 50-79：贡献清楚、实验较完整，但新颖性或实验规模存在明显不足。
+- 20-49：更像 workshop 论文、技术报告或增量式改进。
+- 0-19：综述、立场文章、课程项目或质量存在明显问题的论文。
+如果备注中注明了已被接收的会议或期刊，请以此为准，并在 quality_evaluation 中说明。
+
+四、quality_evaluation：从问题的重要性、方法的新颖性、实验或证明的充分性、写作清晰度四个方面给出评价，指出最主要的优点和不足，避免空泛的套话。
+
+五、author_expert_evaluation：只根据论文中给出的作者和机构信息进行判断；信息不足时直接说明“无法判断”，不要编造作者的履历或所属机构。
+
+六、recommendation_reason：结合用户兴趣说明为什么推荐或不推荐，指出论文中用户最可能关心的具体内容（例如某个技术手段、某组实验结果或某个开源系统）。
+
+校准示例（仅用于说明打分尺度，不要在输出中提及）：
+- 用户兴趣为“GPU 集群上的大模型训练调度”，论文提出一种面向多租户 GPU 集群的训练作业调度器，并在数百张 GPU 上做了端到端实验：relevance_score 为 9 或 10，is_low_quality 为 false，top_conference_probability 约为 75。
+- 用户兴趣同上，论文研究移动端 CNN 推理的算子融合：两者都涉及深度学习系统，但场景和问题不同，relevance_score 约为 5。
+- 用户兴趣同上，论文是一篇没有实验、只罗列若干已有调度算法的短文：relevance_score 可以为 7，但 is_low_quality 为 true，top_conference_probability 低于 10。
+- 用户兴趣为“存储系统与持久化内存”，论文是关于蛋白质结构预测的新模型：relevance_score 为 0 或 1，无论论文质量如何。
+"""
+
 class LLMAgent:
-    def __init__(self):
-        self.client = OpenAI(
+    def __init__(self, cassette=None):
+        self.cassette = cassette or Cassette('off')
+        # 回放时不访问 API，也不要求配置 API Key
+        self.client = None if self.cassette.replaying else OpenAI(
             api_key=os.getenv('OPENROUTER_API_KEY') or os.getenv('OPENAI_API_KEY'),
             base_url=os.getenv('OPENROUTER_BASE_URL') or os.getenv('OPENAI_BASE_URL', 'https://openrouter.ai/api/v1'),
             default_headers={
@@ -16,6 +60,49 @@ class LLMAgent:
             }
         )
         self.model = os.getenv('LLM_MODEL', 'anthropic/claude-3.5-sonnet')
+        # 最近一次调用的 token 消耗，供预算调度使用
+        self.last_usage = None
+        # 最近一次调用的原始返回内容，供 trace 记录
+        self.last_response = None
+        # 用于检查 prompt 缓存是否生效
+        self._analysis_calls = 0
+        self._cache_checked = False
+
+    @staticmethod
+    def _usage_of(response):
+        """从响应中提取 token 用量"""
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None
+        details = getattr(usage, 'prompt_tokens_details', None)
+        if isinstance(details, dict):
+            cached_tokens = details.get('cached_tokens', 0)
+            cache_write_tokens = details.get('cache_write_tokens', 0)
+        else:
+            cached_tokens = getattr(details, 'cached_tokens', 0)
+            cache_write_tokens = getattr(details, 'cache_write_tokens', 0)
+        return {
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+            # 命中服务端 prompt 缓存的输入 token 数
+            'cached_tokens': cached_tokens or 0,
+            # 写入缓存的输入 token 数（OpenRouter 对 Anthropic 等模型返回）
+            'cache_write_tokens': cache_write_tokens or 0,
+        }
+
+    def _chat(self, operation, messages, fallback=None, **kwargs):
+        """
+        调用 chat completions，返回文本内容并记录 token 用量
+        通过 cassette 执行，便于录制和回放；fallback 标识同一个逻辑请求，prompt 变化后回放仍能对应到它
+        """
+        def create():
+            response = self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+            return {'content': response.choices[0].message.content, 'usage': self._usage_of(response)}
+
+        result = self.cassette.call('llm', operation, {'model': self.model, 'messages': messages, **kwargs}, create,
+                                    fallback=fallback)
+        self.last_usage = result['usage']
+        return result['content']
 
     def summarize_interests(self, topics):
         """
@@ -40,15 +127,13 @@ class LLMAgent:
 
 请直接输出总结后的用户画像内容：
 """
+        self.last_usage = None
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个擅长总结学术背景的助手。"},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content.strip()
+            content = self._chat('summarize_interests', [
+                {"role": "system", "content": "你是一个擅长总结学术背景的助手。"},
+                {"role": "user", "content": prompt}
+            ], fallback={})
+            return content.strip()
         except Exception as e:
             print(f"Error summarizing interests: {e}")
             return "General AI and Computer Science"
@@ -110,58 +195,92 @@ class LLMAgent:
                 print(f"Error details: {e2}")
                 return None
 
-    def analyze_paper(self, paper_info, user_interests, full_text=None):
+    def _supports_cache_control(self):
         """
-        分析单篇论文：总结、评价质量、打分
+        是否显式设置 cache_control 断点
+        OpenRouter 上的 Anthropic / Gemini 模型需要显式断点；OpenAI 等模型按前缀自动缓存，无需设置
+        """
+        mode = os.getenv('LLM_PROMPT_CACHE', 'auto').lower()
+        if mode in ('on', 'true', '1'):
+            return True
+        if mode in ('off', 'false', '0'):
+            return False
+        return self.model.startswith(('anthropic/', 'google/gemini'))
+
+    def build_analysis_messages(self, paper_info, user_interests, full_text=None):
+        """
+        构造 analyze_paper 使用的 messages，便于在调用前估算 token 开销
+
+        稳定不变的部分（角色、输出格式、评分标准、用户兴趣画像）放在最前面作为可缓存前缀，
+        每篇论文不同的内容放在最后，使同一次运行内的调用都能命中服务端的 prompt 缓存。
         """
         context_text = full_text if full_text else paper_info['summary']
         text_type = "全文提取内容" if full_text else "摘要"
 
-        prompt = f"""
-你是一个资深的学术论文分析专家和计算机科学家。请根据以下论文信息和用户的兴趣主题，对论文进行深度分析。
+        instructions = """你是一个学术辅助助手，也是资深的学术论文分析专家和计算机科学家，擅长分析 Arxiv 论文。
+请根据用户提供的论文信息和下面的用户兴趣主题，对论文进行深度分析。
+如果提供的是全文提取内容，请基于全文进行更深入的分析，而不仅仅是摘要。
 
-用户兴趣主题：
-{user_interests}
+你必须仅输出有效的 JSON。请严格按以下 JSON 格式输出分析结果。不要包含任何额外的解释文字，确保所有的反斜杠都已经正确转义（特别是数学公式或特殊符号），并且不要在最后一个字段后加逗号。
 
-论文信息：
+{
+    "summary_cn": "基于提供的论文内容（摘要或全文提取内容），给出一个准确、深刻的中文总结（300字以内）",
+    "summary_en": "An accurate and profound English summary based on the provided content (within 150 words)",
+    "quality_evaluation": "对论文 quality 的深度评价",
+    "top_conference_probability": 85,
+    "author_expert_evaluation": "评估作者是否为该领域的知名专家，以及文章是否来自于顶级名校或顶尖研究机构（如 Google, OpenAI, Stanford 等）",
+    "relevance_score": 10,
+    "is_low_quality": false,
+    "recommendation_reason": "结合论文内容给出的推荐理由或不推荐理由"
+}
+"""
+        stable_prefix = f"{instructions}\n{SCORING_RUBRIC}\n用户兴趣主题：\n{user_interests}\n"
+
+        system_part = {"type": "text", "text": stable_prefix}
+        if self._supports_cache_control():
+            # 缓存断点：此处之前的内容在整次运行中保持不变
+            system_part["cache_control"] = {"type": "ephemeral"}
+
+        paper_prompt = f"""论文信息：
 标题: {paper_info['title']}
 作者: {", ".join(paper_info['authors'])}
 备注: {paper_info.get('comment', '无')}
 {text_type}:
 {context_text}
+"""
+        return [
+            {"role": "system", "content": [system_part]},
+            {"role": "user", "content": paper_prompt}
+        ]
 
-请注意：如果提供的是全文提取内容，请基于全文进行更深入的分析，而不仅仅是摘要。
-
-请严格按以下 JSON 格式输出分析结果。不要包含任何额外的解释文字，确保所有的反斜杠都已经正确转义（特别是数学公式或特殊符号），并且不要在最后一个字段后加逗号。
-
-请严格按以下 JSON 格式输出分析结果。不要包含任何额外的解释文字，确保所有的反斜杠都已经正确转义（特别是数学公式或特殊符号），并且不要在最后一个字段后加逗号。
+    def _check_prompt_cache(self):
+        """同一前缀的第二次调用之后仍没有缓存命中时给出一次警告"""
+        if self._cache_checked or not self.last_usage:
+            return
+        self._analysis_calls += 1
+        if self.last_usage.get('cached_tokens', 0) > 0:
+            self._cache_checked = True
+        elif self._analysis_calls >= 2:
+            self._cache_checked = True
+            print(f"警告: 连续 {self._analysis_calls} 次分析调用都没有命中 prompt 缓存 (模型 {self.model})，"
+                  f"请检查 LLM_PROMPT_CACHE 设置以及服务商是否支持该模型的缓存")
 
-{{
-    "summary_cn": "基于提供的{text_type}，给出一个准确、深刻的中文总结（300字以内）",
-    "summary_en": "An accurate and profound English summary based on the provided {text_type} (within 150 words)",
-    "analysis_source": "{text_type}",
-    "analysis_source": "{text_type}",
-    "quality_evaluation": "对论文 quality 的深度评价",
-    "top_conference_probability": 85,
-    "top_conference_probability": 85,
-    "author_expert_evaluation": "评估作者是否为该领域的知名专家，以及文章是否来自于顶级名校或顶尖研究机构（如 Google, OpenAI, Stanford 等）",
-    "relevance_score": 10,
-    "is_low_quality": false,
-    "recommendation_reason": "结合全文给出的推荐理由或不推荐理由"
-}}
-"""
+    def analyze_paper(self, paper_info, user_interests, full_text=None):
+        """
+        分析单篇论文：总结、评价质量、打分
+        """
+        messages = self.build_analysis_messages(paper_info, user_interests, full_text=full_text)
+        self.last_usage = None
+        self.last_response = None
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个学术辅助助手，擅长分析 Arxiv 论文。你必须仅输出有效的 JSON。你必须仅输出有效的 JSON。"},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
-            content = response.choices[0].message.content
+            # 同一篇论文的摘要筛选和全文分析分别对应
+            fallback = {'paper': paper_id(paper_info), 'full_text': bool(full_text)}
+            content = self._chat('analyze_paper', messages, fallback=fallback, response_format={"type": "json_object"})
+            self.last_response = content
+            self._check_prompt_cache()
             result = self._parse_json(content)
             if result:
+                result['analysis_source'] = "全文提取内容" if full_text else "摘要"
                 # 确保关键字段存在
                 required_fields = ['recommendation_reason', 'quality_evaluation', 'relevance_score']
                 for field in required_fields:
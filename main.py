@@ -2,66 +2,308 @@ import logging
 import json
 import os
 import datetime
+import time
+import argparse
 from zotero_client import ZoteroClient
 from arxiv_client import ArxivClient
 from llm_agent import LLMAgent
 from report_generator import ReportGenerator
 from email_sender import EmailSender
+from budget_scheduler import BudgetScheduler
+from trace_store import TraceStore
+from relevance_model import RelevanceModel
+from cassette import Cassette
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class PaperAgent:
-    def __init__(self):
-        self.zotero = ZoteroClient()
-        self.arxiv = ArxivClient()
-        self.llm = LLMAgent()
+    # 录制时需要快照的本地状态文件，回放时据此还原运行前的状态
+    STATE_FILES = ["agent_state.json", "zotero_interests.json", "relevance_model.npz", "relevance_samples.jsonl"]
+    # 录制时保存、回放时还原的非敏感运行配置，使回放不依赖本地的 .env
+    CONFIG_ENV = [
+        "ARXIV_CATEGORIES", "ZOTERO_USER_ID", "ZOTERO_GROUP_IDS", "LLM_MODEL", "LLM_PROMPT_CACHE",
+        "DAILY_TOKEN_BUDGET", "DAILY_COST_BUDGET", "LLM_INPUT_PRICE_PER_MTOK", "LLM_OUTPUT_PRICE_PER_MTOK",
+        "LLM_CACHED_INPUT_PRICE_PER_MTOK", "LLM_CACHE_WRITE_PRICE_MULTIPLIER", "LLM_EXPECTED_OUTPUT_TOKENS",
+        "FULL_TEXT_ESTIMATE_CHARS", "SCREENING_BUDGET_RATIO", "DEFERRED_MAX_DAYS",
+        "LOCAL_SCREENING", "LOCAL_REJECT_PROB", "LOCAL_MIN_SAMPLES", "LOCAL_AUDIT_RATE", "LOCAL_MIN_RECALL",
+        "LOCAL_CONFUSION_HALF_LIFE", "REPORT_SHOW_OWNED",
+    ]
+
+    def __init__(self, cassette=None):
+        self.cassette = cassette or Cassette()
+        self.cassette.snapshot_files(self.STATE_FILES)
+        self.cassette.snapshot_env(self.CONFIG_ENV)
+        # 需要在创建各客户端之前还原配置
+        self.cassette.restore_env()
+        self.zotero = ZoteroClient(cassette=self.cassette)
+        self.arxiv = ArxivClient(cassette=self.cassette)
+        self.llm = LLMAgent(cassette=self.cassette)
         self.report = ReportGenerator()
-        self.email = EmailSender()
-        self.debug_dir = "debug"
+        self.email = EmailSender(cassette=self.cassette)
+        self.budget = BudgetScheduler()
+        self.relevance = RelevanceModel(seed=self.cassette.seed)
         self.state_file = "agent_state.json"
-        if not os.path.exists(self.debug_dir):
-            os.makedirs(self.debug_dir)
+        self.trace = None
 
-    def _get_last_run_time(self):
-        """获取上次运行时间"""
+    def _load_state(self):
+        """读取状态文件"""
         if os.path.exists(self.state_file):
             try:
                 with open(self.state_file, 'r') as f:
-                    state = json.load(f)
-                    last_run_str = state.get('last_run_time')
-                    if last_run_str:
-                        return datetime.datetime.fromisoformat(last_run_str)
+                    return json.load(f)
             except Exception as e:
                 logging.error(f"读取状态文件失败: {e}")
+        return {}
+
+    def _get_last_run_time(self):
+        """获取上次运行时间"""
+        last_run_str = self._load_state().get('last_run_time')
+        if last_run_str:
+            return datetime.datetime.fromisoformat(last_run_str)
         return None
 
-    def _save_last_run_time(self, timestamp):
-        """保存当前运行时间"""
+    @staticmethod
+    def _serialize_papers(papers):
+        """将论文列表转换为可写入状态文件的形式"""
+        return [
+            {**p, 'published': p['published'].isoformat() if hasattr(p.get('published'), 'isoformat') else p.get('published')}
+            for p in papers
+        ]
+
+    @staticmethod
+    def _deserialize_papers(papers):
+        for paper in papers:
+            if isinstance(paper.get('published'), str):
+                paper['published'] = datetime.datetime.fromisoformat(paper['published'])
+        return papers
+
+    def _get_deferred_papers(self):
+        """获取上次因预算不足而推迟处理的论文"""
+        return self._deserialize_papers(self._load_state().get('deferred_papers', []))
+
+    def _get_daemon_backlog(self):
+        """
+        从常驻模式切换回定时任务时，接管常驻模式尚未发送的分析结果和排队的论文
+        返回: (已分析待发送的论文, 排队待筛选的论文)
+        """
+        daemon = self._load_state().get('daemon', {})
+        return (self._deserialize_papers(daemon.get('pending_papers', [])),
+                self._deserialize_papers(daemon.get('queued_papers', [])))
+
+    def _drop_expired_deferred(self, papers, now):
+        """丢弃推迟超过 DEFERRED_MAX_DAYS 天的论文，避免预算长期不足时积压无限增长"""
+        max_days = float(os.getenv('DEFERRED_MAX_DAYS') or 3)
+        if max_days <= 0:
+            return papers
+        cutoff = now - datetime.timedelta(days=max_days)
+        kept = []
+        for paper in papers:
+            deferred_at = paper.get('deferred_at')
+            if deferred_at and datetime.datetime.fromisoformat(deferred_at) < cutoff:
+                self.trace.log('deferred_expired', paper, deferred_at=deferred_at)
+            else:
+                kept.append(paper)
+        if len(kept) < len(papers):
+            logging.warning(f"{len(papers) - len(kept)} 篇论文推迟超过 {max_days:g} 天，已放弃处理。")
+        return kept
+
+    def _save_state(self, **updates):
+        """更新状态文件中的指定字段"""
         try:
-            state = {'last_run_time': timestamp.isoformat()}
+            state = self._load_state()
+            state.update(updates)
             with open(self.state_file, 'w') as f:
-                json.dump(state, f)
+                json.dump(state, f, ensure_ascii=False)
         except Exception as e:
             logging.error(f"保存状态文件失败: {e}")
 
-    def _save_debug_data(self, data, filename):
-        """保存调试数据到 JSON 文件"""
-        file_path = os.path.join(self.debug_dir, filename)
-        try:
-            # 处理 datetime 对象，使其可 JSON 序列化
-            def datetime_handler(x):
-                if hasattr(x, 'isoformat'):
-                    return x.isoformat()
-                return str(x)
-
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=datetime_handler)
-            logging.info(f"调试数据已保存至: {file_path}")
-        except Exception as e:
-            logging.error(f"保存调试数据 {filename} 失败: {e}")
+    def _save_last_run_time(self, timestamp, deferred_papers=None):
+        """保存当前运行时间以及推迟到下次运行的论文"""
+        updates = {'last_run_time': timestamp.isoformat(),
+                   'deferred_papers': self._serialize_papers(deferred_papers or [])}
+        daemon = self._load_state().get('daemon')
+        if daemon:
+            # 常驻模式的待发送和排队论文已由本次运行接管
+            updates['daemon'] = {**daemon, 'pending_papers': [], 'queued_papers': []}
+        self._save_state(**updates)
+
+    @staticmethod
+    def _get_categories():
+        categories_str = os.getenv('ARXIV_CATEGORIES', 'cs.DC,cs.AR')
+        return [c.strip() for c in categories_str.split(',')]
+
+    def _get_user_interests(self):
+        """从 Zotero 获取兴趣主题，必要时调用 LLM 重新生成兴趣画像"""
+        logging.info("正在从 Zotero 获取兴趣主题...")
+        topics, is_updated, cached_profile = self.zotero.get_recent_paper_topics(limit=50)
+        # 只记录数量，trace 中不保存 Zotero 标题和标签原文
+        self.trace.log('zotero_topics', topic_count=len(topics), is_updated=is_updated)
+        
+        if not topics:
+            logging.warning("未能从 Zotero 获取到主题，将使用默认推荐逻辑。")
+            return "General AI and Computer Science"
+
+        # 如果 Zotero 兴趣有更新，或者还没有生成过画像，则调用 LLM 生成
+        if is_updated or not cached_profile:
+            logging.info("检测到兴趣更新或画像缺失，正在生成 LLM 兴趣画像总结...")
+            start = time.perf_counter()
+            user_interests = self.llm.summarize_interests(topics)
+            self.trace.log('summarize_interests', response=user_interests, usage=self.llm.last_usage,
+                           elapsed=time.perf_counter() - start)
+            self.budget.charge(self.llm.last_usage)
+            self.zotero.update_summarized_profile(user_interests)
+            logging.info(f"新生成的兴趣画像: {user_interests}")
+        else:
+            logging.info("使用缓存的兴趣画像。")
+            user_interests = cached_profile
+            logging.info(f"当前兴趣画像: {user_interests}")
+        return user_interests
+
+    def _filter_owned(self, papers):
+        """
+        在筛选前剔除已经在用户 Zotero 库中的论文
+        返回: (待筛选的论文, 已收藏的论文)
+        """
+        remaining, owned = [], []
+        for paper in papers:
+            if self.zotero.is_in_library(paper):
+                logging.info(f"论文已在 Zotero 库中，跳过: {paper['title']}")
+                self.trace.log('owned', paper)
+                owned.append(paper)
+            else:
+                remaining.append(paper)
+        return remaining, owned
+
+    def _defer(self, papers):
+        """标记因预算不足推迟处理的论文，记录首次推迟的时间，超过 DEFERRED_MAX_DAYS 后放弃"""
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        for paper in papers:
+            paper.setdefault('deferred_at', now)
+            self.trace.log('deferred', paper)
+
+    def _screen_papers(self, papers, user_interests):
+        """
+        第一步：基于摘要进行初步筛选，本地模型高置信度拒绝的论文不再调用 LLM
+        返回: (通过筛选的候选论文, 因预算不足推迟到下次运行的论文)
+        """
+        candidates = []
+        for i, paper in enumerate(papers):
+            skip, local_prob = self.relevance.screen(paper)
+            if skip:
+                logging.info(f"本地模型跳过论文: {paper['title']} (P={local_prob:.3f})")
+                self.trace.log('local_reject', paper, probability=local_prob)
+                continue
+
+            messages = self.llm.build_analysis_messages(paper, user_interests)
+            estimated_tokens = self.budget.estimate_messages(messages)
+            if not self.budget.can_screen(estimated_tokens):
+                logging.warning(f"筛选预算已用尽，剩余 {len(papers) - i} 篇论文推迟到下次运行。")
+                self._defer(papers[i:])
+                return candidates, papers[i:]
+
+            logging.info(f"正在进行初步筛选: {paper['title']}")
+            start = time.perf_counter()
+            analysis = self.llm.analyze_paper(paper, user_interests)
+            self.trace.log('screen', paper, messages=messages, response=self.llm.last_response,
+                           analysis=analysis, usage=self.llm.last_usage, elapsed=time.perf_counter() - start,
+                           local_probability=local_prob, local_audit=paper.get('local_audit', False))
+            self.budget.charge(self.llm.last_usage, estimated_tokens)
+            if not analysis:
+                continue
+            self.relevance.record(paper, analysis, local_prob)
+
+            # 过滤低质量或不相关的论文
+            if analysis.get('is_low_quality', False) or analysis.get('relevance_score', 0) < 7:
+                logging.info(f"初步筛选跳过论文: {paper['title']} (Score: {analysis.get('relevance_score', 0)})")
+                continue
+
+            paper['analysis'] = analysis
+            candidates.append(paper)
+        return candidates, []
+
+    def _analyze_candidates(self, candidates, user_interests):
+        """
+        第二步：按筛选得分从高到低，在预算允许的范围内下载全文进行深度分析
+        超出预算的论文保留摘要分析结果，并在报告中注明
+        """
+        analyzed_papers = []
+        candidates = sorted(candidates, key=lambda p: p['analysis'].get('relevance_score', 0), reverse=True)
+        full_text_estimate = self.budget.estimate_full_text_tokens()
+
+        for paper in candidates:
+            abstract_tokens = self.budget.estimate_messages(self.llm.build_analysis_messages(paper, user_interests))
+            if not self.budget.can_analyze(abstract_tokens + full_text_estimate):
+                logging.info(f"预算不足，仅使用摘要分析结果: {paper['title']}")
+                self.trace.log('budget_limited', paper, estimated_tokens=abstract_tokens + full_text_estimate)
+                paper['budget_limited'] = True
+                analyzed_papers.append(paper)
+                continue
+
+            logging.info(f"初步筛选通过，正在下载全文进行深度分析: {paper['title']}")
+            start = time.perf_counter()
+            full_text = self.arxiv.download_pdf_text(paper['pdf_url'])
+            self.trace.log('download', paper, pdf_url=paper['pdf_url'], chars=len(full_text),
+                           elapsed=time.perf_counter() - start)
+
+            if not full_text:
+                # 如果全文下载失败，保留初次分析结果
+                logging.warning(f"全文下载失败，使用摘要分析结果: {paper['title']}")
+                analyzed_papers.append(paper)
+                continue
+
+            # 以实际全文长度再次确认预算
+            messages = self.llm.build_analysis_messages(paper, user_interests, full_text=full_text)
+            estimated_tokens = self.budget.estimate_messages(messages)
+            if not self.budget.can_analyze(estimated_tokens):
+                logging.info(f"全文超出剩余预算，仅使用摘要分析结果: {paper['title']}")
+                self.trace.log('budget_limited', paper, estimated_tokens=estimated_tokens)
+                paper['budget_limited'] = True
+                analyzed_papers.append(paper)
+                continue
+
+            # 使用全文进行二次深度分析
+            start = time.perf_counter()
+            deep_analysis = self.llm.analyze_paper(paper, user_interests, full_text=full_text)
+            self.trace.log('deep_analysis', paper, messages=messages, response=self.llm.last_response,
+                           analysis=deep_analysis, usage=self.llm.last_usage, elapsed=time.perf_counter() - start)
+            self.budget.charge(self.llm.last_usage, estimated_tokens)
+            if deep_analysis:
+                paper['analysis'] = deep_analysis
+                analyzed_papers.append(paper)
+                logging.info(f"深度分析完成: {paper['title']}")
+        return analyzed_papers
+
+    def _deliver_report(self, analyzed_papers, deferred_count=0, owned_papers=None):
+        """生成 Markdown 报告并通过邮件发送"""
+        # 按相关度排序
+        analyzed_papers.sort(key=lambda x: x['analysis']['relevance_score'], reverse=True)
+        
+        # 生成本地 Markdown 报告
+        report_md_path = self.report.generate_markdown(analyzed_papers, deferred_count=deferred_count,
+                                                       owned_papers=owned_papers)
+        
+        # 读取 Markdown 内容用于发送邮件
+        with open(report_md_path, 'r', encoding='utf-8') as f:
+            report_content = f.read()
+        
+        # 发送邮件
+        logging.info("正在发送邮件报告...")
+        subject = f"Arxiv Daily Paper Curation - {datetime.date.today().isoformat()}"
+        self.email.send_report(subject, report_content)
+        logging.info(f"报告已保存至: {report_md_path}")
 
     def run(self):
+        self.trace = TraceStore()
+        logging.info(f"本次运行的 trace 写入: {self.trace.run_dir}")
+        try:
+            self._run()
+        finally:
+            self.trace.close()
+            self.cassette.save()
+            self.cassette.report_misses()
+
+    def _run(self):
         logging.info("开始执行每日论文推荐任务...")
         
         # 获取上次运行时间
@@ -74,95 +316,76 @@ class PaperAgent:
             logging.info("首次运行，将获取最近的论文。")
 
         # 1. 从 Arxiv 获取指定分类的新论文
-        categories_str = os.getenv('ARXIV_CATEGORIES', 'cs.DC,cs.AR')
-        categories = [c.strip() for c in categories_str.split(',')]
+        categories = self._get_categories()
         logging.info(f"正在从 Arxiv 抓取分类论文: {categories}...")
         
         # 增加 max_results 以确保在增量抓取时不会漏掉
         raw_papers = self.arxiv.fetch_by_categories(categories, max_results=100, since_date=last_run_time)
-        self._save_debug_data(raw_papers, "1_arxiv_raw_papers.json")
+        for paper in raw_papers:
+            self.trace.log('fetch', paper, metadata=paper)
         logging.info(f"抓取到 {len(raw_papers)} 篇自上次运行以来的新论文。")
 
+        # 上次因预算不足推迟的论文优先处理
+        daemon_pending, daemon_queued = self._get_daemon_backlog()
+        if daemon_pending or daemon_queued:
+            logging.info(f"接管常驻模式的 {len(daemon_pending)} 篇待发送论文和 {len(daemon_queued)} 篇排队论文。")
+        deferred_papers = self._drop_expired_deferred(daemon_queued + self._get_deferred_papers(), current_run_time)
+        if deferred_papers:
+            logging.info(f"加入上次推迟的 {len(deferred_papers)} 篇论文。")
+            seen_urls = {p['url'] for p in deferred_papers}
+            raw_papers = deferred_papers + [p for p in raw_papers if p['url'] not in seen_urls]
+
         if not raw_papers:
             logging.warning("未能从 Arxiv 获取到论文，请检查网络或分类设置。")
             return
 
         # 2. 从 Zotero 获取兴趣主题作为筛选标准
-        logging.info("正在从 Zotero 获取兴趣主题...")
-        topics, is_updated, cached_profile = self.zotero.get_recent_paper_topics(limit=50)
-        self._save_debug_data(topics, "2_zotero_topics.json")
-        
-        if not topics:
-            logging.warning("未能从 Zotero 获取到主题，将使用默认推荐逻辑。")
-            user_interests = "General AI and Computer Science"
-        else:
-            # 如果 Zotero 兴趣有更新，或者还没有生成过画像，则调用 LLM 生成
-            if is_updated or not cached_profile:
-                logging.info("检测到兴趣更新或画像缺失，正在生成 LLM 兴趣画像总结...")
-                user_interests = self.llm.summarize_interests(topics)
-                self.zotero.update_summarized_profile(user_interests)
-                logging.info(f"新生成的兴趣画像: {user_interests}")
-            else:
-                logging.info("使用缓存的兴趣画像。")
-                user_interests = cached_profile
-                logging.info(f"当前兴趣画像: {user_interests}")
+        user_interests = self._get_user_interests()
 
-        # 3. 使用 LLM 根据兴趣筛选和分析论文
-        analyzed_papers = []
-        for paper in raw_papers:
-            logging.info(f"正在进行初步筛选: {paper['title']}")
-            # 第一步：基于摘要进行初步筛选
-            analysis = self.llm.analyze_paper(paper, user_interests)
-            
-            if analysis:
-                # 过滤低质量或不相关的论文
-                if analysis.get('is_low_quality', False) or analysis.get('relevance_score', 0) < 7:
-                    logging.info(f"初步筛选跳过论文: {paper['title']} (Score: {analysis.get('relevance_score', 0)})")
-                    continue
-                
-                # 第二步：对于初步筛选通过的论文，下载全文进行深度分析
-                logging.info(f"初步筛选通过，正在下载全文进行深度分析: {paper['title']}")
-                full_text = self.arxiv.download_pdf_text(paper['pdf_url'])
-                
-                if full_text:
-                    # 使用全文进行二次深度分析
-                    deep_analysis = self.llm.analyze_paper(paper, user_interests, full_text=full_text)
-                    if deep_analysis:
-                        paper['analysis'] = deep_analysis
-                        analyzed_papers.append(paper)
-                        logging.info(f"深度分析完成: {paper['title']}")
-                else:
-                    # 如果全文下载失败，保留初次分析结果
-                    logging.warning(f"全文下载失败，使用摘要分析结果: {paper['title']}")
-                    paper['analysis'] = analysis
-                    analyzed_papers.append(paper)
-        
-        self._save_debug_data(analyzed_papers, "3_analyzed_papers.json")
+        # 3. 跳过已收藏的论文，再使用 LLM 根据兴趣筛选和分析论文
+        raw_papers, owned_papers = self._filter_owned(raw_papers)
+        candidates, deferred_papers = self._screen_papers(raw_papers, user_interests)
+        self.relevance.save()
+        logging.info(f"本地相关度模型: {self.relevance.summary()}")
+        analyzed_papers = daemon_pending + self._analyze_candidates(candidates, user_interests)
+        logging.info(f"LLM 预算使用情况: {self.budget.summary()}")
+        self.trace.log('run_summary', analyzed=len(analyzed_papers), deferred=len(deferred_papers), owned=len(owned_papers),
+                       local_model_trained=self.relevance.n_trained, local_model_confusion=self.relevance.confusion.tolist(),
+                       used_input_tokens=self.budget.used_input_tokens,
+                       used_cached_tokens=self.budget.used_cached_tokens,
+                       used_output_tokens=self.budget.used_output_tokens, used_cost=self.budget.used_cost)
 
         # 4. 生成并发送报告
         if analyzed_papers:
-            # 按相关度排序
-            analyzed_papers.sort(key=lambda x: x['analysis']['relevance_score'], reverse=True)
-            
-            # 生成本地 Markdown 报告
-            report_md_path = self.report.generate_markdown(analyzed_papers)
-            
-            # 读取 Markdown 内容用于发送邮件
-            with open(report_md_path, 'r', encoding='utf-8') as f:
-                report_content = f.read()
-            
-            # 发送邮件
-            logging.info("正在发送邮件报告...")
-            subject = f"Arxiv Daily Paper Curation - {datetime.date.today().isoformat()}"
-            self.email.send_report(subject, report_content)
-            logging.info(f"报告已保存至: {report_md_path}")
+            self._deliver_report(analyzed_papers, deferred_count=len(deferred_papers), owned_papers=owned_papers)
         else:
             logging.info("没有找到符合条件的论文，未生成报告。")
 
         # 任务成功完成后，更新运行时间
-        self._save_last_run_time(current_run_time)
+        self._save_last_run_time(current_run_time, deferred_papers)
+        if deferred_papers:
+            logging.info(f"{len(deferred_papers)} 篇论文因预算不足推迟到下次运行。")
         logging.info("任务执行完毕，已更新运行时间。")
 
 if __name__ == "__main__":
-    agent = PaperAgent()
+    parser = argparse.ArgumentParser(description="Arxiv 论文推荐 Agent")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='CASSETTE', help="录制本次运行的所有外部调用到 cassette 文件")
+    group.add_argument('--replay', metavar='CASSETTE', help="离线回放 cassette 文件中录制的运行")
+    args = parser.parse_args()
+
+    if args.record:
+        cassette = Cassette('record', args.record)
+    elif args.replay:
+        cassette = Cassette('replay', args.replay)
+    else:
+        cassette = Cassette()
+
+    if cassette.replaying:
+        # 回放在独立目录中进行，不会修改线上状态文件
+        workspace = cassette.restore_workspace()
+        logging.info(f"回放工作目录: {workspace}")
+        os.chdir(workspace)
+
+    agent = PaperAgent(cassette=cassette)
     agent.run()
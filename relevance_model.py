@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import zlib
+import random
+import numpy as np
+
+
+class RelevanceModel:
+    """
+    基于历史 LLM 打分训练的本地相关度模型
+
+    使用哈希 n-gram 特征 + 逻辑回归，以 analyze_paper 产生的 (摘要, relevance_score) 作为标签增量训练。
+    模型对某篇论文给出高置信度的"不相关"判断时跳过 LLM 筛选；其中一小部分随机抽样仍交给 LLM 复核，
+    用来持续统计模型的拒绝准确率和召回率。
+    """
+    n_features = 2 ** 18
+
+    def __init__(self, model_file="relevance_model.npz", samples_file="relevance_samples.jsonl", seed=None):
+        self.model_file = model_file
+        self.samples_file = samples_file
+        self.enabled = os.getenv('LOCAL_SCREENING', 'on').lower() not in ('off', 'false', '0')
+        # 低于该概率视为高置信度拒绝
+        self.reject_prob = float(os.getenv('LOCAL_REJECT_PROB') or 0.05)
+        # 累计训练样本达到该数量后才开始跳过 LLM
+        self.min_samples = int(os.getenv('LOCAL_MIN_SAMPLES') or 300)
+        # 本应被拒绝的论文中随机送往 LLM 复核的比例
+        self.audit_rate = float(os.getenv('LOCAL_AUDIT_RATE') or 0.1)
+        # 复核得到的召回率低于该值时停止跳过
+        self.min_recall = float(os.getenv('LOCAL_MIN_RECALL') or 0.95)
+        # 混淆计数的半衰期（样本数），使召回率统计反映模型的近期表现而不是全部历史
+        half_life = float(os.getenv('LOCAL_CONFUSION_HALF_LIFE') or 500)
+        self.confusion_decay = 0.5 ** (1.0 / half_life) if half_life > 0 else 1.0
+        self.score_threshold = 7
+        self.rng = random.Random(seed)
+
+        self.weights = np.zeros(self.n_features, dtype=np.float32)
+        self.bias = 0.0
+        self.n_trained = 0
+        # 模型判断与 LLM 标签的按样本指数衰减的混淆计数: [tp, fp, tn, fn]，正类为"相关"
+        self.confusion = np.zeros(4, dtype=np.float64)
+        self._new_samples = []
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.model_file):
+            return
+        try:
+            data = np.load(self.model_file)
+            self.weights = data['weights'].astype(np.float32)
+            self.bias = float(data['bias'])
+            self.n_trained = int(data['n_trained'])
+            self.confusion = data['confusion'].astype(np.float64)
+        except Exception as e:
+            print(f"读取本地相关度模型失败: {e}")
+
+    @staticmethod
+    def _text(paper):
+        return f"{paper.get('title', '')} {paper.get('summary', '')}"
+
+    def _vectorize(self, texts):
+        """
+        将文本转换为 CSR 形式的稀疏特征：词级 unigram + bigram，crc32 哈希到固定维度，L2 归一化
+        返回: (row_ids, indices, values)
+        """
+        row_ids, indices, values = [], [], []
+        for row, text in enumerate(texts):
+            tokens = re.findall(r'[a-z0-9]+', text.lower())
+            grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            hashed = np.unique(np.fromiter(
+                (zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint32, count=len(grams)
+            ) % self.n_features)
+            if hashed.size == 0:
+                continue
+            row_ids.append(np.full(hashed.size, row, dtype=np.int64))
+            indices.append(hashed.astype(np.int64))
+            values.append(np.full(hashed.size, 1.0 / np.sqrt(hashed.size), dtype=np.float32))
+        if not indices:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=np.float32)
+        return np.concatenate(row_ids), np.concatenate(indices), np.concatenate(values)
+
+    def _decision(self, row_ids, indices, values, n_rows):
+        z = np.bincount(row_ids, weights=self.weights[indices] * values, minlength=n_rows) + self.bias
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+    def predict_proba(self, papers):
+        """返回每篇论文相关的概率"""
+        texts = [self._text(p) for p in papers]
+        row_ids, indices, values = self._vectorize(texts)
+        return self._decision(row_ids, indices, values, len(texts))
+
+    @property
+    def recall(self):
+        tp, fp, tn, fn = self.confusion
+        return tp / (tp + fn) if tp + fn else None
+
+    @property
+    def rejection_precision(self):
+        tp, fp, tn, fn = self.confusion
+        return tn / (tn + fn) if tn + fn else None
+
+    @property
+    def active(self):
+        """模型是否已足够可靠，可以跳过 LLM"""
+        if not self.enabled or self.n_trained < self.min_samples:
+            return False
+        recall = self.recall
+        tp, fp, tn, fn = self.confusion
+        # 复核样本足够多且召回率过低时，停止跳过，继续积累训练数据
+        if recall is not None and tp + fn >= 20 and recall < self.min_recall:
+            return False
+        return True
+
+    def screen(self, paper):
+        """
+        本地预筛选
+        返回: (是否跳过 LLM, 相关概率)
+        """
+        paper.pop('local_audit', None)
+        if not self.enabled or self.n_trained == 0:
+            return False, None
+        prob = float(self.predict_proba([paper])[0])
+        if not self.active or prob >= self.reject_prob:
+            return False, prob
+        if self.rng.random() < self.audit_rate:
+            paper['local_audit'] = True
+            return False, prob
+        return True, prob
+
+    def record(self, paper, analysis, prob=None):
+        """
+        记录 LLM 的筛选结果作为训练样本，并更新模型判断的混淆计数
+        """
+        score = analysis.get('relevance_score', 0)
+        try:
+            score = float(score)
+        except (TypeError, ValueError):
+            score = 0.0
+        self._new_samples.append({
+            'text': self._text(paper),
+            'score': score,
+            'is_low_quality': bool(analysis.get('is_low_quality', False)),
+        })
+        if prob is None or self.n_trained < self.min_samples:
+            return
+        relevant = self._label(self._new_samples[-1]) == 1.0
+        would_reject = prob < self.reject_prob
+        index = {(True, False): 0, (False, False): 1, (False, True): 2, (True, True): 3}[(relevant, would_reject)]
+        # 旧模型版本的判断逐渐淡出，召回率过低停止跳过后也能随新样本恢复
+        self.confusion *= self.confusion_decay
+        # 被跳过的论文只有复核样本能拿到 LLM 标签，按抽样比例加权还原
+        self.confusion[index] += 1.0 / self.audit_rate if paper.get('local_audit') else 1.0
+
+    def _label(self, sample):
+        return 1.0 if sample['score'] >= self.score_threshold and not sample['is_low_quality'] else 0.0
+
+    def _replay_samples(self, k):
+        """从历史样本中随机抽取 k 条，与新样本一起训练，避免模型只拟合最近一批"""
+        if not os.path.exists(self.samples_file):
+            return []
+        reservoir = []
+        with open(self.samples_file, 'r', encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                if i < k:
+                    reservoir.append(line)
+                else:
+                    j = self.rng.randint(0, i)
+                    if j < k:
+                        reservoir[j] = line
+        return [json.loads(line) for line in reservoir]
+
+    def partial_fit(self, samples, epochs=30, lr=5.0, l2=1e-6):
+        """在一批样本上做若干轮全批量梯度下降，正负样本按比例加权以应对类别不平衡"""
+        if not samples:
+            return
+        row_ids, indices, values = self._vectorize([s['text'] for s in samples])
+        y = np.array([self._label(s) for s in samples], dtype=np.float64)
+        n = len(samples)
+        n_pos = y.sum()
+        sample_weight = np.ones(n)
+        if 0 < n_pos < n:
+            sample_weight[y == 1] = (n - n_pos) / n_pos
+        for _ in range(epochs):
+            p = self._decision(row_ids, indices, values, n)
+            g = (p - y) * sample_weight / n
+            grad = np.bincount(indices, weights=values * g[row_ids], minlength=self.n_features)
+            self.weights -= (lr * (grad + l2 * self.weights)).astype(np.float32)
+            self.bias -= lr * float(g.sum())
+
+    def save(self, replay=500):
+        """用本次新样本（加上部分历史样本）增量训练，并持久化样本和模型"""
+        if not self.enabled:
+            return
+        new_samples = self._new_samples
+        self._new_samples = []
+        try:
+            if new_samples:
+                self.partial_fit(new_samples + self._replay_samples(replay))
+                self.n_trained += len(new_samples)
+                with open(self.samples_file, 'a', encoding='utf-8') as f:
+                    for sample in new_samples:
+                        f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+            np.savez_compressed(self.model_file, weights=self.weights, bias=self.bias,
+                                n_trained=self.n_trained, confusion=self.confusion)
+        except Exception as e:
+            print(f"保存本地相关度模型失败: {e}")
+
+    def summary(self):
+        recall = self.recall
+        precision = self.rejection_precision
+        recall_str = f"{recall:.2%}" if recall is not None else "N/A"
+        precision_str = f"{precision:.2%}" if precision is not None else "N/A"
+        return (f"已训练样本 {self.n_trained}，{'已启用' if self.active else '未启用'}跳过，"
+                f"复核召回率 {recall_str}，拒绝准确率 {precision_str}")
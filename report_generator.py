@@ -4,12 +4,16 @@ import datetime
 class ReportGenerator:
     def __init__(self, output_dir="reports"):
         self.output_dir = output_dir
+        # 是否在报告末尾列出已在 Zotero 库中而被跳过的论文
+        self.show_owned = os.getenv('REPORT_SHOW_OWNED', 'false').lower() in ('true', '1', 'yes')
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-    def generate_markdown(self, analyzed_papers):
+    def generate_markdown(self, analyzed_papers, deferred_count=0, owned_papers=None):
         """
         生成 Markdown 格式的论文报告
+        deferred_count: 因预算不足推迟到下次运行的论文数量
+        owned_papers: 已在 Zotero 库中而被跳过的论文
         """
         if not analyzed_papers:
             print("No papers to generate report.")
@@ -21,11 +25,24 @@ class ReportGenerator:
 
         md_content = f"# 每日 Arxiv 论文推荐报告 ({date_str})\n\n"
         md_content += f"基于您的 Zotero 兴趣库为您筛选了以下 {len(analyzed_papers)} 篇论文：\n\n"
+
+        budget_limited = [p for p in analyzed_papers if p.get('budget_limited')]
+        if budget_limited or deferred_count:
+            md_content += "> **预算说明:**\n"
+            if budget_limited:
+                md_content += f"> 以下 {len(budget_limited)} 篇论文因本次运行的 LLM 预算限制，仅基于摘要进行分析：\n"
+                for p in budget_limited:
+                    md_content += f"> - {p['title']}\n"
+            if deferred_count:
+                md_content += f"> 另有 {deferred_count} 篇论文因预算不足尚未筛选，将在下次运行时处理。\n"
+            md_content += "\n"
         md_content += "---\n\n"
 
         for p in analyzed_papers:
             source = p['analysis'].get('analysis_source', '未知来源')
             source_emoji = "📄" if "全文" in source else "📝"
+            if p.get('budget_limited'):
+                source += "（预算限制，仅摘要）"
             conf_prob = p['analysis'].get('top_conference_probability', 0)
             author_eval = p['analysis'].get('author_expert_evaluation', '暂无评估')
             
@@ -42,6 +59,13 @@ class ReportGenerator:
             md_content += f"- **PDF 链接:** [下载 PDF]({p['pdf_url']})\n\n"
             md_content += "---\n\n"
 
+        if self.show_owned and owned_papers:
+            md_content += "## 已在您的 Zotero 库中\n\n"
+            md_content += f"以下 {len(owned_papers)} 篇新论文已在您的 Zotero 库中，未再重复分析：\n\n"
+            for p in owned_papers:
+                md_content += f"- [{p['title']}]({p['url']})\n"
+            md_content += "\n"
+
         try:
             with open(file_path, "w", encoding="utf-8") as f:
                 f.write(md_content)
@@ -0,0 +1,119 @@
+import os
+import datetime
+import pytest
+from cassette import Cassette, CassetteMiss
+
+
+def test_record_then_replay(tmp_path):
+    path = str(tmp_path / "run.jsonl.gz")
+    published = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    calls = []
+
+    def fetch():
+        calls.append('fetch')
+        return [{'title': 'A', 'published': published}]
+
+    def chat():
+        calls.append('chat')
+        return {'content': '{"relevance_score": 8}', 'usage': {'prompt_tokens': 10, 'completion_tokens': 2}}
+
+    recorder = Cassette('record', path)
+    assert recorder.call('arxiv', 'fetch_by_categories', {'categories': ['cs.DC']}, fetch)[0]['title'] == 'A'
+    assert recorder.call('llm', 'analyze_paper', {'messages': ['p1']}, chat,
+                         fallback={'paper': 'A'})['usage']['prompt_tokens'] == 10
+    recorder.save()
+
+    def offline():
+        raise AssertionError("回放时不应访问外部服务")
+
+    player = Cassette('replay', path)
+    assert player.seed == recorder.seed
+    papers = player.call('arxiv', 'fetch_by_categories', {'categories': ['cs.DC']}, offline)
+    # datetime 在回放时还原为原类型
+    assert papers[0]['published'] == published
+    # 参数变化时按 fallback 回放同一个逻辑请求
+    assert player.call('llm', 'analyze_paper', {'messages': ['p2']}, offline,
+                       fallback={'paper': 'A'})['content'] == '{"relevance_score": 8}'
+    assert calls == ['fetch', 'chat']
+
+
+def test_changed_prompt_never_returns_another_request(tmp_path):
+    path = str(tmp_path / "llm.jsonl.gz")
+    recorder = Cassette('record', path)
+    recorder.call('llm', 'summarize_interests', {'messages': ['topics']}, lambda: 'profile text', fallback={})
+    recorder.call('llm', 'analyze_paper', {'messages': ['A v1']}, lambda: 'analysis A',
+                  fallback={'paper': 'A', 'full_text': False})
+    recorder.save()
+
+    player = Cassette('replay', path)
+    # 修改后的 prompt 先于兴趣画像调用，也只会对应到同一篇论文的录制结果
+    assert player.call('llm', 'analyze_paper', {'messages': ['A v2']}, None,
+                       fallback={'paper': 'A', 'full_text': False}) == 'analysis A'
+    with pytest.raises(CassetteMiss):
+        player.call('llm', 'analyze_paper', {'messages': ['B']}, None, fallback={'paper': 'B', 'full_text': False})
+    with pytest.raises(CassetteMiss):
+        player.call('llm', 'analyze_paper', {'messages': ['A full']}, None, fallback={'paper': 'A', 'full_text': True})
+    assert player.call('llm', 'summarize_interests', {'messages': ['other topics']}, None, fallback={}) == 'profile text'
+
+
+def test_replay_uses_recorded_config(tmp_path, monkeypatch):
+    path = str(tmp_path / "env.jsonl.gz")
+    monkeypatch.setenv('ARXIV_CATEGORIES', 'cs.DC')
+    monkeypatch.delenv('DAILY_TOKEN_BUDGET', raising=False)
+    recorder = Cassette('record', path)
+    recorder.snapshot_env(['ARXIV_CATEGORIES', 'DAILY_TOKEN_BUDGET'])
+    recorder.save()
+
+    # 本地 .env 与录制时不同
+    monkeypatch.setenv('ARXIV_CATEGORIES', 'cs.CL')
+    monkeypatch.setenv('DAILY_TOKEN_BUDGET', '1000')
+    Cassette('replay', path).restore_env()
+    assert os.environ['ARXIV_CATEGORIES'] == 'cs.DC'
+    assert 'DAILY_TOKEN_BUDGET' not in os.environ
+
+
+def test_replay_miss_is_reported(tmp_path):
+    path = str(tmp_path / "empty.jsonl.gz")
+    Cassette('record', path).save()
+
+    player = Cassette('replay', path)
+    with pytest.raises(CassetteMiss):
+        player.call('arxiv', 'download_pdf_text', {'pdf_url': 'x'}, lambda: "")
+    assert player.misses == ['arxiv.download_pdf_text']
+
+
+def test_recorded_error_is_replayed(tmp_path):
+    path = str(tmp_path / "error.jsonl.gz")
+
+    def fail():
+        raise ValueError("boom")
+
+    recorder = Cassette('record', path)
+    with pytest.raises(ValueError):
+        recorder.call('zotero', 'items', {'limit': 1}, fail)
+    recorder.save()
+
+    with pytest.raises(RuntimeError, match="boom"):
+        Cassette('replay', path).call('zotero', 'items', {'limit': 1}, fail)
+
+
+def test_restore_workspace_replaces_previous_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("agent_state.json", "w") as f:
+        f.write('{"last_run_time": "2025-01-01T00:00:00+00:00"}')
+
+    path = str(tmp_path / "state.jsonl.gz")
+    recorder = Cassette('record', path)
+    recorder.snapshot_files(["agent_state.json", "relevance_samples.jsonl"])
+    recorder.save()
+
+    workspace = path + ".workspace"
+    os.makedirs(workspace)
+    # 上一次回放留下的状态文件
+    with open(os.path.join(workspace, "relevance_samples.jsonl"), "w") as f:
+        f.write('{"text": "stale"}\n')
+
+    assert Cassette('replay', path).restore_workspace() == workspace
+    assert sorted(os.listdir(workspace)) == ["agent_state.json"]
+    with open(os.path.join(workspace, "agent_state.json")) as f:
+        assert "2025-01-01" in f.read()
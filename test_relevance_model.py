@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from relevance_model import RelevanceModel
+
+RELEVANT = ["gpu cluster scheduling", "distributed training systems", "parameter server communication",
+            "pipeline parallelism for large models"]
+IRRELEVANT = ["protein structure prediction", "galaxy rotation curves", "medieval poetry corpus",
+              "soil moisture estimation"]
+
+
+def _paper(topic, i):
+    return {'title': f"On {topic}", 'summary': f"We study {topic} in setting {i}."}
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOCAL_MIN_SAMPLES', '40')
+    monkeypatch.setenv('LOCAL_AUDIT_RATE', '0.5')
+    monkeypatch.setenv('LOCAL_REJECT_PROB', '0.2')
+    return RelevanceModel(str(tmp_path / "model.npz"), str(tmp_path / "samples.jsonl"), seed=0)
+
+
+def _train(model, n=40):
+    for i in range(n):
+        relevant = i % 2 == 0
+        topics = RELEVANT if relevant else IRRELEVANT
+        topic = topics[(i // 2) % len(topics)]
+        model.record(_paper(topic, i), {'relevance_score': 9 if relevant else 2})
+    model.save()
+
+
+def test_vectorize_is_l2_normalised(model):
+    row_ids, indices, values = model._vectorize(["gpu cluster gpu", ""])
+    # 重复的 n-gram 只计一次，空文本没有特征
+    assert set(row_ids.tolist()) == {0}
+    assert np.all(indices < model.n_features)
+    assert np.isclose(np.sum(values ** 2), 1.0)
+
+
+def test_partial_fit_separates_classes(model, tmp_path):
+    _train(model)
+    probs = model.predict_proba([_paper(t, 99) for t in RELEVANT + IRRELEVANT])
+    assert probs[:len(RELEVANT)].min() > 0.5 > probs[len(RELEVANT):].max()
+
+    reloaded = RelevanceModel(str(tmp_path / "model.npz"), str(tmp_path / "samples.jsonl"))
+    assert reloaded.n_trained == 40
+    assert np.allclose(reloaded.predict_proba([_paper(RELEVANT[0], 0)]), model.predict_proba([_paper(RELEVANT[0], 0)]))
+
+
+def test_screen_skips_confident_rejections_and_audits(model):
+    _train(model)
+    assert model.active
+    decisions = []
+    for i in range(40):
+        paper = _paper(IRRELEVANT[i % len(IRRELEVANT)], i)
+        skip, prob = model.screen(paper)
+        assert prob < model.reject_prob
+        decisions.append((skip, paper.get('local_audit', False)))
+    # 本应被拒绝的论文要么被跳过，要么作为复核样本交给 LLM
+    assert all(skip != audit for skip, audit in decisions)
+    assert 0 < sum(audit for _, audit in decisions) < len(decisions)
+
+    skip, prob = model.screen(_paper(RELEVANT[0], 0))
+    assert not skip and prob >= model.reject_prob
+
+
+def test_record_weights_audited_samples(model):
+    _train(model)
+    audited = _paper(RELEVANT[0], 0)
+    audited['local_audit'] = True
+    model.record(audited, {'relevance_score': 9}, prob=0.01)
+    # 复核样本按 1 / audit_rate 加权计入漏判 (fn)
+    assert model.confusion[3] == pytest.approx(2.0)
+    model.record(_paper(RELEVANT[1], 1), {'relevance_score': 9}, prob=0.9)
+    assert model.confusion[0] == pytest.approx(1.0)
+    assert model.recall == pytest.approx(1.0 / 3.0, rel=1e-2)
+
+
+def test_confusion_decays_so_recall_guard_recovers(model):
+    _train(model)
+    model.confusion[:] = [0, 0, 0, 40]
+    assert not model.active
+    for i in range(3000):
+        model.record(_paper(RELEVANT[i % len(RELEVANT)], i), {'relevance_score': 9}, prob=0.9)
+    assert model.recall > model.min_recall
+    assert model.active
@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip("pyzotero")
+pytest.importorskip("dotenv")
+
+from zotero_client import ZoteroClient, extract_arxiv_id, normalize_doi, normalize_title
+
+
+def _item(key, **data):
+    return {'key': key, 'version': 1, 'data': {'key': key, **data}}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('ZOTERO_USER_ID', raising=False)
+    monkeypatch.delenv('ZOTERO_GROUP_IDS', raising=False)
+    return ZoteroClient()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("https://arxiv.org/abs/2401.01234v2", "2401.01234"),
+    ("http://arxiv.org/pdf/2401.01234", "2401.01234"),
+    ("10.48550/arXiv.2401.01234", "2401.01234"),
+    ("arXiv: 2401.01234", "2401.01234"),
+    ("https://arxiv.org/abs/hep-th/9901001v1", "hep-th/9901001"),
+    ("https://example.com/paper.pdf", None),
+    ("", None),
+])
+def test_extract_arxiv_id(text, expected):
+    assert extract_arxiv_id(text) == expected
+
+
+def test_normalize_doi_and_title():
+    assert normalize_doi("https://doi.org/10.1145/ABC.123") == "10.1145/abc.123"
+    assert normalize_doi("doi: 10.1145/abc.123") == "10.1145/abc.123"
+    assert normalize_doi("") is None
+    assert normalize_title("Attention Is All You Need!") == normalize_title("attention is all-you need")
+
+
+def test_index_item_and_is_in_library(client):
+    client._index_item('user:1', _item('A', url='https://arxiv.org/abs/2401.01234v1', title='First Paper'))
+    client._index_item('user:1', _item('B', DOI='10.1145/XYZ', title='Second Paper'))
+    client._index_item('group:2', _item('C', extra='arXiv: 2402.00001', title='Third Paper'))
+
+    assert client.is_in_library({'url': 'http://arxiv.org/abs/2401.01234v3', 'title': 'Other'})
+    assert client.is_in_library({'url': '', 'doi': 'https://doi.org/10.1145/xyz', 'title': 'Other'})
+    assert client.is_in_library({'url': 'http://arxiv.org/abs/2402.00001v1', 'title': ''})
+    assert client.is_in_library({'url': '', 'title': 'first paper'})
+    assert not client.is_in_library({'url': 'http://arxiv.org/abs/2403.00001v1', 'title': 'Unknown'})
+
+
+def test_removed_and_trashed_items_leave_the_index(client):
+    client._index_item('user:1', _item('A', url='https://arxiv.org/abs/2401.01234', title='First Paper'))
+    client._index_item('user:1', _item('B', title='Second Paper'))
+    assert client.is_in_library({'url': '', 'title': 'Second Paper'})
+
+    # 永久删除
+    client._remove_items('user:1', ['B', 'missing'])
+    assert not client.is_in_library({'url': '', 'title': 'Second Paper'})
+
+    # 移入回收站
+    client._index_item('user:1', _item('A', url='https://arxiv.org/abs/2401.01234', title='First Paper', deleted=1))
+    assert not client.is_in_library({'url': 'http://arxiv.org/abs/2401.01234v1', 'title': 'First Paper'})
+    assert client.library_index == {'user:1': {}}
+
+
+def test_index_survives_reload(client):
+    client._index_item('user:1', _item('A', DOI='10.1/abc', title='First Paper'))
+    client._save_cache([], {'user:1': 3}, library_index=client.library_index)
+
+    reloaded = ZoteroClient()
+    assert reloaded.is_in_library({'url': '', 'doi': '10.1/ABC', 'title': ''})
+    assert reloaded.library_index['user:1']['A']['title'] == 'firstpaper'
@@ -0,0 +1,35 @@
+import os
+import json
+import argparse
+from trace_store import TraceStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看 Paper Agent 的运行 trace")
+    parser.add_argument('--dir', default=os.getenv('TRACE_DIR', 'traces'), help="trace 根目录")
+    parser.add_argument('--run', help="运行 ID，默认最近一次运行")
+    parser.add_argument('--paper', help="按 Arxiv ID 过滤，例如 2401.01234")
+    parser.add_argument('--stage', help="按阶段过滤，例如 screen / deep_analysis")
+    parser.add_argument('--fields', help="只输出指定字段（逗号分隔），例如 stage,paper_id,elapsed")
+    parser.add_argument('--list', action='store_true', help="列出所有运行 ID")
+    args = parser.parse_args()
+
+    runs = TraceStore.list_runs(args.dir)
+    if args.list:
+        for run in runs:
+            print(run)
+        return
+    if not runs:
+        print(f"{args.dir} 下没有 trace")
+        return
+
+    run = args.run or runs[-1]
+    fields = [f.strip() for f in args.fields.split(',')] if args.fields else None
+    for record in TraceStore.iter_records(os.path.join(args.dir, run), paper=args.paper, stage=args.stage):
+        if fields:
+            record = {k: record.get(k) for k in fields}
+        print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import io
+import re
+import gzip
+import json
+import shutil
+import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def paper_id(paper):
+    """从论文链接中提取 Arxiv ID（去掉版本号），用作 trace 中的论文标识"""
+    url = paper.get('url', '') if paper else ''
+    match = re.search(r'/abs/([^/]+?)(v\d+)?$', url)
+    return match.group(1) if match else url or None
+
+
+def _json_default(x):
+    # 处理 datetime 对象，使其可 JSON 序列化
+    if hasattr(x, 'isoformat'):
+        return x.isoformat()
+    return str(x)
+
+
+class TraceStore:
+    """
+    按运行追加写入的压缩 JSONL trace
+
+    每次运行对应 trace_dir 下的一个目录，目录内为按大小轮转的分片文件
+    (part-000.jsonl.gz / .jsonl.zst ...)，每行一条记录，最多保留最近 retention_runs 次运行。
+    """
+    def __init__(self, trace_dir=None, run_id=None):
+        self.trace_dir = trace_dir or os.getenv('TRACE_DIR', 'traces')
+        self.max_part_bytes = int(float(os.getenv('TRACE_MAX_PART_MB') or 64) * 1024 * 1024)
+        self.retention_runs = int(os.getenv('TRACE_RETENTION_RUNS') or 14)
+        compression = os.getenv('TRACE_COMPRESSION', 'gzip').lower()
+        if compression == 'zstd' and zstandard is None:
+            print("未安装 zstandard，trace 改用 gzip 压缩")
+            compression = 'gzip'
+        self.compression = compression
+        self.run_id = run_id or datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self.run_dir = os.path.join(self.trace_dir, self.run_id)
+        self._part_bytes = 0
+        self._fh = None
+        os.makedirs(self.run_dir, exist_ok=True)
+        # 同一 run_id 重复打开时（如常驻模式按天写入）从新的分片继续，不覆盖已有分片
+        self._part = len([n for n in os.listdir(self.run_dir) if n.startswith('part-')]) - 1
+        self._apply_retention()
+
+    def _apply_retention(self):
+        """删除超出保留数量的旧运行"""
+        runs = self.list_runs(self.trace_dir)
+        for old_run in runs[:-self.retention_runs] if self.retention_runs > 0 else []:
+            if old_run != self.run_id:
+                shutil.rmtree(os.path.join(self.trace_dir, old_run), ignore_errors=True)
+
+    def _open_next_part(self):
+        self.close()
+        self._part += 1
+        self._part_bytes = 0
+        suffix = 'zst' if self.compression == 'zstd' else 'gz'
+        path = os.path.join(self.run_dir, f"part-{self._part:03d}.jsonl.{suffix}")
+        if self.compression == 'zstd':
+            raw = open(path, 'wb')
+            self._fh = io.TextIOWrapper(zstandard.ZstdCompressor(level=6).stream_writer(raw), encoding='utf-8')
+        else:
+            self._fh = gzip.open(path, 'at', encoding='utf-8', compresslevel=6)
+
+    def log(self, stage, paper=None, **fields):
+        """追加一条记录：一篇论文在某个阶段的输入、输出和耗时"""
+        record = {
+            'ts': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'run_id': self.run_id,
+            'stage': stage,
+            'paper_id': paper_id(paper) if paper else None,
+        }
+        if paper:
+            record['title'] = paper.get('title')
+        record.update(fields)
+        try:
+            line = json.dumps(record, ensure_ascii=False, default=_json_default) + "\n"
+            if self._fh is None or self._part_bytes >= self.max_part_bytes:
+                self._open_next_part()
+            self._fh.write(line)
+            self._part_bytes += len(line.encode('utf-8'))
+        except Exception as e:
+            print(f"写入 trace 失败 ({stage}): {e}")
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    @staticmethod
+    def list_runs(trace_dir='traces'):
+        """按时间顺序列出已有的运行 ID"""
+        if not os.path.isdir(trace_dir):
+            return []
+        return sorted(d for d in os.listdir(trace_dir) if os.path.isdir(os.path.join(trace_dir, d)))
+
+    @staticmethod
+    def iter_records(run_dir, paper=None, stage=None):
+        """
+        逐行读取某次运行的 trace，可按论文 ID 和阶段过滤
+        """
+        for name in sorted(os.listdir(run_dir)):
+            path = os.path.join(run_dir, name)
+            if name.endswith('.gz'):
+                fh = gzip.open(path, 'rt', encoding='utf-8')
+            elif name.endswith('.zst'):
+                if zstandard is None:
+                    print(f"未安装 zstandard，跳过 {path}")
+                    continue
+                fh = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+            else:
+                continue
+            with fh:
+                try:
+                    for line in fh:
+                        if not line.strip():
+                            continue
+                        record = json.loads(line)
+                        if paper and record.get('paper_id') != paper:
+                            continue
+                        if stage and record.get('stage') != stage:
+                            continue
+                        yield record
+                except (EOFError, json.JSONDecodeError):
+                    # 运行中断时最后一个分片可能不完整
+                    continue
@@ -3,15 +3,44 @@ import re
 import json
 from pyzotero import zotero
 from dotenv import load_dotenv
+from cassette import Cassette
 
 load_dotenv()
 
+ARXIV_ID_PATTERN = r'(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?'
+
+
+def extract_arxiv_id(text):
+    """从 URL、DOI 或 extra 字段中提取不带版本号的 Arxiv ID"""
+    if not text:
+        return None
+    match = re.search(r'arxiv\.org/(?:abs|pdf)/' + ARXIV_ID_PATTERN, text, re.IGNORECASE)
+    match = match or re.search(r'arxiv[:.]\s*' + ARXIV_ID_PATTERN, text, re.IGNORECASE)
+    return match.group(1).lower() if match else None
+
+
+def normalize_doi(doi):
+    if not doi:
+        return None
+    doi = re.sub(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', '', doi.strip(), flags=re.IGNORECASE)
+    return doi.lower() or None
+
+
+def normalize_title(title):
+    """标题归一化：小写并去掉所有非字母数字字符"""
+    return re.sub(r'[\W_]+', '', title.lower()) if title else None
+
+
 class ZoteroClient:
-    def __init__(self):
+    def __init__(self, cassette=None):
+        self.cassette = cassette or Cassette('off')
         self.api_key = os.getenv('ZOTERO_API_KEY')
         self.user_id = os.getenv('ZOTERO_USER_ID')
         self.group_ids_str = os.getenv('ZOTERO_GROUP_IDS', '')
         self.cache_file = "zotero_interests.json"
+        self.library_index = None
+        # 由 library_index 汇总得到的查找集合，索引变化后重新生成
+        self._lookup = None
         
         self.zot_instances = []
         
@@ -25,6 +54,11 @@ class ZoteroClient:
             for gid in group_ids:
                 self.zot_instances.append(zotero.Zotero(gid, 'group', self.api_key))
 
+    def _call(self, zot, operation, func, **kwargs):
+        """通过 cassette 调用 Zotero API，便于录制和回放"""
+        args = {'library': f"{zot.library_type}:{zot.library_id}", **kwargs}
+        return self.cassette.call('zotero', operation, args, func)
+
     def _is_noise(self, text):
         """
         判断是否为 ID 格式的噪声（如 Arxiv ID 2509.00531v1）
@@ -48,20 +82,94 @@ class ZoteroClient:
                 print(f"读取 Zotero 缓存失败: {e}")
         return {"interests": [], "library_versions": {}, "summarized_profile": ""}
 
-    def _save_cache(self, interests, library_versions, summarized_profile=None):
-        """保存兴趣主题和版本号到本地"""
+    def _save_cache(self, interests, library_versions, summarized_profile=None, library_index=None):
+        """保存兴趣主题、版本号和论文库索引到本地"""
         try:
             cache = self._load_cache()
             data = {
                 "interests": list(set(interests)),
                 "library_versions": library_versions,
-                "summarized_profile": summarized_profile if summarized_profile else cache.get("summarized_profile", "")
+                "summarized_profile": summarized_profile if summarized_profile else cache.get("summarized_profile", ""),
+                "library_index": library_index if library_index is not None else cache.get("library_index", {})
             }
             with open(self.cache_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
         except Exception as e:
             print(f"保存 Zotero 缓存失败: {e}")
 
+    def _load_library_index(self):
+        """
+        加载论文库索引: {库: {条目 key: 该条目的 Arxiv ID / DOI / 归一化标题}}
+        按条目保存，库中删除条目后可以从索引中移除
+        """
+        if self.library_index is None:
+            index = self._load_cache().get("library_index", {})
+            # 旧版本缓存的索引不区分库和条目，无法应用删除，丢弃后重新建立
+            self.library_index = {lib_key: items for lib_key, items in index.items()
+                                  if ':' in lib_key and isinstance(items, dict)}
+            self._lookup = None
+        return self.library_index
+
+    def _index_item(self, lib_key, item):
+        """将 Zotero 条目的 URL、DOI、extra 和标题加入索引"""
+        data = item.get('data', {})
+        key = item.get('key') or data.get('key')
+        if not key:
+            return
+        items = self._load_library_index().setdefault(lib_key, {})
+        self._lookup = None
+        if data.get('deleted'):
+            # 已移入回收站的条目
+            items.pop(key, None)
+            return
+        arxiv_ids = {extract_arxiv_id(data.get(field, '')) for field in ('url', 'DOI', 'extra', 'archiveID')}
+        items[key] = {
+            "arxiv_ids": sorted(a for a in arxiv_ids if a),
+            "doi": normalize_doi(data.get('DOI', '')),
+            "title": normalize_title(data.get('title', '')),
+        }
+
+    def _remove_items(self, lib_key, keys):
+        """从索引中移除库中已删除的条目"""
+        items = self._load_library_index().get(lib_key, {})
+        for key in keys:
+            items.pop(key, None)
+        self._lookup = None
+
+    def _fetch_all_for_index(self, zot, lib_key):
+        """抓取库中全部条目以首次建立该库的索引，之后随版本号增量更新"""
+        items = self._call(zot, 'top_all', lambda: zot.everything(zot.top()))
+        self._load_library_index()[lib_key] = {}
+        for item in items:
+            self._index_item(lib_key, item)
+        return items
+
+    def _get_lookup(self):
+        """汇总所有库的索引，生成用于 O(1) 判断的查找集合"""
+        if self._lookup is None:
+            lookup = {"arxiv_ids": set(), "dois": set(), "titles": set()}
+            for items in self._load_library_index().values():
+                for entry in items.values():
+                    lookup["arxiv_ids"].update(entry.get("arxiv_ids", []))
+                    if entry.get("doi"):
+                        lookup["dois"].add(entry["doi"])
+                    if entry.get("title"):
+                        lookup["titles"].add(entry["title"])
+            self._lookup = lookup
+        return self._lookup
+
+    def is_in_library(self, paper):
+        """判断论文是否已在用户的 Zotero 库中"""
+        lookup = self._get_lookup()
+        arxiv_id = extract_arxiv_id(paper.get('url', ''))
+        if arxiv_id and arxiv_id in lookup["arxiv_ids"]:
+            return True
+        doi = normalize_doi(paper.get('doi', ''))
+        if doi and doi in lookup["dois"]:
+            return True
+        title = normalize_title(paper.get('title', ''))
+        return bool(title) and title in lookup["titles"]
+
     def get_recent_paper_topics(self, limit=50):
         """
         增量式获取 Zotero 兴趣主题
@@ -77,28 +185,50 @@ class ZoteroClient:
         is_updated = False
         
         is_first_run = not os.path.exists(self.cache_file)
+        library_index = self._load_library_index()
+        index_updated = False
         
         for zot in self.zot_instances:
             lib_key = f"{zot.library_type}:{zot.library_id}"
             last_version = library_versions.get(lib_key, 0)
+            # 该库还没有完整的索引（新加入的库或旧版本缓存），需要完整抓取一次来建立
+            needs_full_index = lib_key not in library_index
             
             try:
-                # 获取当前库的最新版本号
-                current_version = zot.items(limit=1)[0]['version'] if zot.items(limit=1) else last_version
+                # 获取当前库的版本号，条目的修改和删除都会使其增加
+                current_version = self._call(zot, 'last_modified_version', zot.last_modified_version)
                 
                 # 如果是第一次运行，或者版本有更新
                 if is_first_run or current_version > last_version:
-                    is_updated = True
                     # 如果是第一次运行，我们可能需要抓取更多条目来构建初始画像
                     fetch_limit = 200 if is_first_run else limit
                     
+                    all_items = self._fetch_all_for_index(zot, lib_key) if needs_full_index else None
+
                     # 使用 since 参数进行增量抓取（如果不是第一次运行）
                     if last_version > 0:
-                        items = zot.everything(zot.items(since=last_version))
+                        # API 默认不返回回收站中的条目，需要显式包含，才能将移入回收站的条目从索引中移除
+                        items = self._call(zot, 'items_since',
+                                           lambda: zot.everything(zot.items(since=last_version, includeTrashed=1)),
+                                           since=last_version, includeTrashed=1)
+                        if all_items is None:
+                            # 将上次以来删除的条目从索引中移除
+                            deleted = self._call(zot, 'deleted', lambda: zot.deleted(since=last_version),
+                                                 since=last_version)
+                            self._remove_items(lib_key, deleted.get('items', []))
+                    elif all_items is not None:
+                        # 已经抓取了全部条目，兴趣主题只取最近的 fetch_limit 条
+                        items = all_items[:fetch_limit]
                     else:
-                        items = zot.top(limit=fetch_limit)
+                        items = self._call(zot, 'top', lambda: zot.top(limit=fetch_limit), limit=fetch_limit)
                     
+                    # 只有删除或集合等变化时没有新条目，不需要重新生成兴趣画像
+                    is_updated = is_updated or is_first_run or any(not i.get('data', {}).get('deleted') for i in items)
                     for item in items:
+                        self._index_item(lib_key, item)
+                        if item.get('data', {}).get('deleted'):
+                            # 回收站中的条目不计入兴趣主题
+                            continue
                         # 获取标题
                         title = item.get('data', {}).get('title', '')
                         if title and not self._is_noise(title):
@@ -112,6 +242,11 @@ class ZoteroClient:
                                 new_interests.append(tag_text)
                     
                     updated_versions[lib_key] = current_version
+                    index_updated = True
+                elif needs_full_index:
+                    # 库没有更新，但缓存中缺少该库的索引：只建立索引，不触发兴趣画像更新
+                    self._fetch_all_for_index(zot, lib_key)
+                    index_updated = True
                 else:
                     print(f"Zotero 库 {lib_key} 无更新 (version: {last_version})")
                     
@@ -122,8 +257,8 @@ class ZoteroClient:
         all_interests = list(set(cached_interests + new_interests))
         
         # 如果有新内容，更新缓存（此时暂不更新 profile，由 main.py 总结后更新）
-        if is_updated:
-            self._save_cache(all_interests, updated_versions, cached_profile)
+        if is_updated or index_updated:
+            self._save_cache(all_interests, updated_versions, cached_profile, self.library_index)
         
         return all_interests, is_updated, cached_profile
 